@@ -0,0 +1,55 @@
+"""
+Сравнение кодеков значений кэша (db.codecs.CacheCodec): размер значения в Redis
+и время encode/decode для записи Film, страницы FilmShort и записи об отсутствии.
+
+Кодеки, для которых не установлен пакет (msgpack, zstandard, lz4), пропускаются.
+
+Запуск: PYTHONPATH=src python benchmarks/bench_codecs.py
+"""
+import argparse
+import time
+from typing import Any, Callable
+
+from bench_response_path import make_film, make_films_short
+from db.codecs import COMPRESSOR_IDS, SERIALIZER_IDS, CacheCodec
+
+
+def timed(fn: Callable[[], Any], iterations: int) -> float:
+    fn()
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--cast-size', type=int, default=30)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--threshold', type=int, default=1024)
+    args = parser.parse_args()
+
+    film = make_film(args.cast_size)
+    # Конверт в том виде, в котором его пишет ModelCache
+    values = {
+        'film': {'e': time.time(), 'h': '0' * 32, 'v': film.dict()},
+        'film_search': {'e': time.time(), 'h': '0' * 32, 'v': [f.dict() for f in make_films_short(args.page_size)]},
+        'not_found': {'e': time.time(), 'n': 1},
+    }
+
+    print(f'{"value":<12} {"codec":<14} {"bytes":>8} {"encode us":>10} {"decode us":>10}')
+    for name, value in values.items():
+        for serializer in SERIALIZER_IDS:
+            for compression in COMPRESSOR_IDS:
+                codec = CacheCodec(serializer, compression, threshold=args.threshold)
+                data = codec.encode(value)
+                assert codec.decode(data) == value
+                encode_us = timed(lambda: codec.encode(value), args.iterations)
+                decode_us = timed(lambda: codec.decode(data), args.iterations)
+                print(f'{name:<12} {serializer + "+" + compression:<14} {len(data):>8} '
+                      f'{encode_us:>10.1f} {decode_us:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
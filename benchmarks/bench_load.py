@@ -0,0 +1,188 @@
+"""
+Нагрузочный бенчмарк API: настоящее FastAPI-приложение внутри процесса, вместо Elasticsearch и Redis -
+заглушки из fakes.py с задержкой сети, данные - синтетический каталог из catalog.py.
+
+Для каждой ручки /v1, уровня конкурентности и доли попаданий в кэш печатает RPS и p50/p95/p99.
+Доля попаданий задаётся выбором запросов: с вероятностью hit ratio запрос берётся из заранее
+прогретого набора, иначе - ещё не встречавшийся запрос. Перед каждым прогоном кэши сбрасываются.
+
+Запуск: PYTHONPATH=src python benchmarks/bench_load.py --json results.json
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlencode
+
+import orjson
+
+import config
+import main
+from catalog import FIRST_NAMES, WORDS, Catalog, make_catalog
+from db import cache, elastic
+from fakes import FakeElasticsearch, FakeRedis, Latency
+
+Request = Tuple[str, Dict[str, str]]
+
+
+@dataclass
+class Result:
+    endpoint: str
+    concurrency: int
+    hit_ratio: float
+    requests: int
+    errors: int
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+async def asgi_get(path: str, params: Dict[str, str]) -> int:
+    # Минимальный ASGI-клиент: без сети и без потоков, измеряется только само приложение
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': urlencode(params).encode(), 'root_path': '',
+        'headers': [(b'host', b'bench')], 'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+    status = 0
+
+    async def receive() -> dict:
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await main.app(scope, receive, send)
+    return status
+
+
+def endpoint_requests(catalog: Catalog) -> Dict[str, Callable[[], List[Request]]]:
+    # Все различающиеся запросы к ручке: из них берутся и прогретые, и промахи
+    films, persons, genres = list(catalog['movies']), list(catalog['persons']), list(catalog['genres'])
+    return {
+        'film_details': lambda: [(f'/v1/film/{film_id}', {}) for film_id in films],
+        'film_search': lambda: [('/v1/film/', {'query': word, 'page[number]': str(page), 'page[size]': '10'})
+                                for word in WORDS for page in range(1, 51)],
+        'genre_list': lambda: [('/v1/genre/', {'page[number]': '1', 'page[size]': str(size)})
+                               for size in range(1, 101)],
+        'genre_details': lambda: [(f'/v1/genre/{genre_id}', {'page[number]': str(page), 'page[size]': '10'})
+                                  for genre_id in genres for page in range(1, 51)],
+        'person_details': lambda: [(f'/v1/person/{person_id}', {}) for person_id in persons],
+        'person_search': lambda: [('/v1/person/', {'query': name, 'page[number]': str(page), 'page[size]': '10'})
+                                  for name in FIRST_NAMES for page in range(1, 51)],
+        'person_films': lambda: [(f'/v1/person/{person_id}/film', {}) for person_id in persons],
+    }
+
+
+def reset_backends(es: FakeElasticsearch, redis_latency: Latency) -> None:
+    # Заглушка elastic переиспользуется: её внутренний кэш выборок не относится к кэшам сервиса
+    cache.local_caches.clear()
+    cache.cache = cache.RedisCacheStorage(FakeRedis(redis_latency), ttl=config.CACHE_TTL)
+    elastic.es = es
+
+
+def percentile(values: List[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1] if len(values) > 1 else values[0]
+
+
+async def run(endpoint: str, all_requests: List[Request], concurrency: int, hit_ratio: float, total: int,
+              hot_keys: int, rng: random.Random) -> Result:
+    rng.shuffle(all_requests)
+    hot, cold = all_requests[:hot_keys], all_requests[hot_keys:]
+    for path, params in hot:
+        await asgi_get(path, params)
+
+    plan = []
+    cold_index = 0
+    for _ in range(total):
+        if rng.random() < hit_ratio or not cold:
+            plan.append(rng.choice(hot))
+        else:
+            # Промахи не повторяются, пока не кончится набор; дальше они станут попаданиями
+            plan.append(cold[cold_index % len(cold)])
+            cold_index += 1
+
+    latencies = []
+    errors = 0
+    queue = iter(plan)
+
+    async def worker() -> None:
+        nonlocal errors
+        for path, params in queue:
+            started = time.perf_counter()
+            status = await asgi_get(path, params)
+            latencies.append(time.perf_counter() - started)
+            if status >= 500:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return Result(
+        endpoint=endpoint, concurrency=concurrency, hit_ratio=hit_ratio, requests=total, errors=errors,
+        rps=round(total / elapsed, 1),
+        p50_ms=round(percentile(latencies, 50) * 1000, 3),
+        p95_ms=round(percentile(latencies, 95) * 1000, 3),
+        p99_ms=round(percentile(latencies, 99) * 1000, 3),
+    )
+
+
+async def bench(args: argparse.Namespace) -> List[Result]:
+    catalog = make_catalog(films=args.films, persons=args.persons, genres=args.genres, seed=args.seed)
+    es_latency = Latency(args.es_latency / 1000, args.jitter / 1000, seed=args.seed)
+    redis_latency = Latency(args.redis_latency / 1000, args.jitter / 1000, seed=args.seed)
+    es = FakeElasticsearch(catalog, es_latency)
+    requests_by_endpoint = endpoint_requests(catalog)
+    endpoints = args.endpoints or list(requests_by_endpoint)
+
+    results = []
+    print(f'{"endpoint":<16} {"conc":>5} {"hit":>5} {"rps":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"err":>4}')
+    for endpoint in endpoints:
+        for concurrency in args.concurrency:
+            for hit_ratio in args.hit_ratio:
+                reset_backends(es, redis_latency)
+                result = await run(endpoint, requests_by_endpoint[endpoint](), concurrency, hit_ratio,
+                                   args.requests, args.hot_keys, random.Random(args.seed))
+                results.append(result)
+                print(f'{endpoint:<16} {concurrency:>5} {hit_ratio:>5.2f} {result.rps:>9.1f} {result.p50_ms:>8.2f} '
+                      f'{result.p95_ms:>8.2f} {result.p99_ms:>8.2f} {result.errors:>4}')
+    return results
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', nargs='*', help='по умолчанию все')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--hit-ratio', type=float, nargs='+', default=[0.0, 0.5, 0.9])
+    parser.add_argument('--requests', type=int, default=1000, help='запросов на каждый прогон')
+    parser.add_argument('--hot-keys', type=int, default=50, help='размер прогретого набора запросов')
+    parser.add_argument('--films', type=int, default=5000)
+    parser.add_argument('--persons', type=int, default=2000)
+    parser.add_argument('--genres', type=int, default=19)
+    parser.add_argument('--es-latency', type=float, default=2.0, help='мс на вызов Elasticsearch')
+    parser.add_argument('--redis-latency', type=float, default=0.3, help='мс на вызов Redis')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, мс')
+    parser.add_argument('--local-cache-size', type=int, default=config.LOCAL_CACHE_SIZE,
+                        help='размер L1, 0 - все попадания идут в Redis')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='сохранить результаты в файл для сравнения между коммитами')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    config.LOCAL_CACHE_SIZE = args.local_cache_size
+    results = asyncio.run(bench(args))
+    if args.json:
+        with open(args.json, 'wb') as f:
+            f.write(orjson.dumps({'args': vars(args), 'results': [asdict(result) for result in results]},
+                                 option=orjson.OPT_INDENT_2))
+
+
+if __name__ == '__main__':
+    main_cli()
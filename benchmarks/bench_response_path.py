@@ -0,0 +1,90 @@
+"""
+Сравнение CPU на сборку ответа для film_details и film_search:
+
+* old - db-модель -> api-модель (from_db_model) -> валидация по response_model и jsonable_encoder
+  в FastAPI -> ORJSONResponse;
+* new - db-модель -> dict (payload_from_db_model) -> ORJSONResponse.
+
+Запуск: PYTHONPATH=src python benchmarks/bench_response_path.py
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, List
+
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import db.models
+from api_v1.models import FilmDetails, FilmShort
+
+
+def make_film(cast_size: int) -> db.models.Film:
+    def people(role: str, count: int) -> List[db.models.IdName]:
+        return [db.models.IdName(id=str(uuid.uuid4()), name=f'{role} {i}') for i in range(count)]
+
+    actors, writers, directors = people('actor', cast_size), people('writer', 3), people('director', 1)
+    genres = people('genre', 3)
+    return db.models.Film(
+        id=str(uuid.uuid4()), title='Star Wars', imdb_rating=8.1, description='A long time ago ' * 20,
+        actors_names=[p.name for p in actors], writers_names=[p.name for p in writers],
+        directors_names=[p.name for p in directors], genres_names=[g.name for g in genres],
+        actors=actors, writers=writers, directors=directors, genres=genres,
+    )
+
+
+def make_films_short(page_size: int) -> List[db.models.FilmShort]:
+    return [db.models.FilmShort(id=str(uuid.uuid4()), title=f'Film {i}', imdb_rating=i % 10) for i in range(page_size)]
+
+
+async def bench(name: str, fn: Callable[[], Awaitable[bytes]], iterations: int) -> float:
+    await fn()
+    started = time.process_time()
+    for _ in range(iterations):
+        await fn()
+    per_request = (time.process_time() - started) / iterations * 1e6
+    print(f'{name:<24} {per_request:10.1f} us/request')
+    return per_request
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--cast-size', type=int, default=30)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    details_field = create_response_field(name='Response_film_details', type_=FilmDetails)
+    search_field = create_response_field(name='Response_film_search', type_=List[FilmShort])
+    film = make_film(args.cast_size)
+    films = make_films_short(args.page_size)
+
+    async def old_film_details() -> bytes:
+        content = await serialize_response(field=details_field, response_content=FilmDetails.from_db_model(film))
+        return ORJSONResponse(content).body
+
+    async def new_film_details() -> bytes:
+        return ORJSONResponse(FilmDetails.payload_from_db_model(film)).body
+
+    async def old_film_search() -> bytes:
+        content = await serialize_response(field=search_field,
+                                           response_content=[FilmShort.from_db_model(f) for f in films])
+        return ORJSONResponse(content).body
+
+    async def new_film_search() -> bytes:
+        return ORJSONResponse([FilmShort.payload_from_db_model(f) for f in films]).body
+
+    assert await old_film_details() == await new_film_details()
+    assert await old_film_search() == await new_film_search()
+
+    for endpoint, old, new in (('film_details', old_film_details, new_film_details),
+                               ('film_search', old_film_search, new_film_search)):
+        old_us = await bench(f'{endpoint} old', old, args.iterations)
+        new_us = await bench(f'{endpoint} new', new, args.iterations)
+        print(f'{endpoint:<24} {old_us - new_us:10.1f} us saved ({old_us / new_us:.1f}x)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
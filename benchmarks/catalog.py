@@ -0,0 +1,179 @@
+"""
+Генератор синтетического каталога для индексов movies, persons и genres
+(схемы schemas/es.*.schema.json) любого размера.
+
+Документы связаны так же, как в боевых индексах: у фильма есть жанры и участники, у персоны -
+film_ids, у жанра - filmworks. Размер состава фильма и популярность персон и жанров распределены
+по Ципфу, поэтому в каталоге есть и жанры с десятками тысяч фильмов, и персоны с тысячами film_ids.
+Генерация детерминирована по seed.
+
+Документы выводятся потоком в формате bulk NDJSON: фильмы пишутся сразу по мере генерации,
+в памяти держатся только персоны и жанры. Загрузка в elastic:
+    python benchmarks/catalog.py --films 100000 --output catalog.ndjson
+    split -l 20000 catalog.ndjson chunk-
+    for f in chunk-*; do curl -s -H 'Content-Type: application/x-ndjson' \\
+        -XPOST localhost:9200/_bulk --data-binary @$f > /dev/null; done
+"""
+import argparse
+import bisect
+import itertools
+import json
+import random
+import sys
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Sequence, Tuple
+
+import orjson
+
+WORDS = ['star', 'war', 'trek', 'night', 'river', 'ghost', 'city', 'love', 'king', 'dark', 'storm', 'road',
+         'last', 'blue', 'silent', 'iron', 'empire', 'dream', 'secret', 'winter', 'fire', 'ocean', 'shadow', 'gold']
+FIRST_NAMES = ['John', 'Anna', 'Chris', 'Maria', 'Peter', 'Olga', 'George', 'Emma', 'Ivan', 'Lucy', 'Mark', 'Nina']
+LAST_NAMES = ['Smith', 'Lucas', 'Ivanova', 'Nolan', 'Brown', 'Petrov', 'Jones', 'Kubrick', 'Garcia', 'Miller']
+GENRE_NAMES = ['Drama', 'Comedy', 'Action', 'Thriller', 'Romance', 'Crime', 'Adventure', 'Horror', 'Documentary',
+               'Family', 'Fantasy', 'Sci-Fi', 'Mystery', 'Animation', 'History', 'Music', 'War', 'Sport', 'Western']
+# Роли персоны: поле фильма и значение в Person.roles
+ROLES = (('actors', 'actor'), ('writers', 'writer'), ('directors', 'director'))
+SCHEMAS_DIR = Path(__file__).resolve().parent.parent / 'schemas'
+
+Catalog = Dict[str, Dict[str, dict]]
+Document = Tuple[str, dict]
+
+
+class Zipf:
+    # Ранги 1..n с вероятностью ~ 1 / rank ** skew; skew=0 - равномерное распределение
+    def __init__(self, n: int, skew: float) -> None:
+        self.n = n
+        self._cum_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, n + 1)))
+
+    def rank(self, rng: random.Random) -> int:
+        return bisect.bisect(self._cum_weights, rng.random() * self._cum_weights[-1]) + 1
+
+    def sample(self, rng: random.Random, population: Sequence, k: int) -> List:
+        # k различных элементов; популярные (в начале population) выпадают чаще
+        k = min(k, len(population))
+        chosen = {}
+        while len(chosen) < k:
+            index = self.rank(rng) - 1
+            chosen[index] = population[index]
+        return list(chosen.values())
+
+
+def make_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def iter_documents(films: int = 1000, persons: int = 500, genres: int = 19, max_cast: int = 50,
+                   cast_skew: float = 1.5, popularity_skew: float = 1.0, seed: int = 0) -> Iterator[Document]:
+    rng = random.Random(seed)
+    genre_docs = []
+    for i in range(genres):
+        name = GENRE_NAMES[i % len(GENRE_NAMES)] + ('' if i < len(GENRE_NAMES) else f' {i}')
+        genre_docs.append({'id': make_id(rng), 'name': name, 'filmworks': []})
+    person_docs = [{'id': make_id(rng), 'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    'roles': [], 'film_ids': []}
+                   for _ in range(persons)]
+    # film_ids и roles персоны без повторов; в документы переносятся в конце
+    person_film_ids: List[Dict[str, None]] = [{} for _ in person_docs]
+    person_roles: List[Dict[str, None]] = [{} for _ in person_docs]
+    person_index = {person['id']: index for index, person in enumerate(person_docs)}
+
+    cast_sizes = Zipf(max_cast, cast_skew)
+    person_popularity = Zipf(len(person_docs), popularity_skew) if person_docs else None
+    genre_popularity = Zipf(len(genre_docs), popularity_skew) if genre_docs else None
+
+    for _ in range(films):
+        film_id = make_id(rng)
+        film = {
+            'id': film_id,
+            'title': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title(),
+            'imdb_rating': round(rng.uniform(1, 10), 1),
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 60))),
+        }
+        for field, role in ROLES:
+            count = cast_sizes.rank(rng) if field == 'actors' else rng.randint(1, 3 if field == 'writers' else 1)
+            cast = person_popularity.sample(rng, person_docs, count) if person_popularity else []
+            film[field] = [{'id': person['id'], 'name': person['full_name']} for person in cast]
+            film[f'{field}_names'] = [person['full_name'] for person in cast]
+            for person in cast:
+                index = person_index[person['id']]
+                person_film_ids[index][film_id] = None
+                person_roles[index][role] = None
+        film_genres = genre_popularity.sample(rng, genre_docs, rng.randint(1, 3)) if genre_popularity else []
+        film['genres'] = [{'id': genre['id'], 'name': genre['name']} for genre in film_genres]
+        film['genres_names'] = [genre['name'] for genre in film_genres]
+        for genre in film_genres:
+            genre['filmworks'].append({'id': film_id, 'title': film['title'], 'imdb_rating': film['imdb_rating']})
+        yield 'movies', film
+
+    for person, film_ids, roles in zip(person_docs, person_film_ids, person_roles):
+        person['film_ids'] = list(film_ids)
+        person['roles'] = list(roles)
+        yield 'persons', person
+    for genre in genre_docs:
+        yield 'genres', genre
+
+
+def make_catalog(films: int = 1000, persons: int = 500, genres: int = 19, seed: int = 0, **kwargs) -> Catalog:
+    catalog: Catalog = {'movies': {}, 'persons': {}, 'genres': {}}
+    for index, doc in iter_documents(films=films, persons=persons, genres=genres, seed=seed, **kwargs):
+        catalog[index][doc['id']] = doc
+    return catalog
+
+
+def load_mappings() -> Dict[str, dict]:
+    return {index: json.loads((SCHEMAS_DIR / f'es.{index}.schema.json').read_text())['mappings']
+            for index in ('movies', 'persons', 'genres')}
+
+
+def check_schema(doc: dict, mapping: dict, path: str = '') -> None:
+    # Индексы со "dynamic": "strict" отклоняют документ с неизвестным полем - проверяем это заранее
+    properties = mapping['properties']
+    for field, value in doc.items():
+        if field not in properties:
+            raise ValueError(f'Field {path}{field} is not in the mapping')
+        if properties[field].get('type') == 'nested':
+            for item in value:
+                check_schema(item, properties[field], f'{path}{field}.')
+
+
+def write_bulk(documents: Iterator[Document], output: BinaryIO, check: bool = False) -> Dict[str, int]:
+    mappings = load_mappings() if check else {}
+    counts = {'movies': 0, 'persons': 0, 'genres': 0}
+    for index, doc in documents:
+        if check:
+            check_schema(doc, mappings[index])
+        output.write(orjson.dumps({'index': {'_index': index, '_id': doc['id']}}))
+        output.write(b'\n')
+        output.write(orjson.dumps(doc))
+        output.write(b'\n')
+        counts[index] += 1
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--films', type=int, default=100000)
+    parser.add_argument('--persons', type=int, default=50000)
+    parser.add_argument('--genres', type=int, default=19)
+    parser.add_argument('--max-cast', type=int, default=50, help='наибольшее число актёров в фильме')
+    parser.add_argument('--cast-skew', type=float, default=1.5, help='показатель Ципфа для размера состава')
+    parser.add_argument('--popularity-skew', type=float, default=1.0,
+                        help='показатель Ципфа для популярности персон и жанров')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check-schema', action='store_true', help='сверять поля документов со схемами индексов')
+    parser.add_argument('--output', default='-', help='файл NDJSON, по умолчанию stdout')
+    args = parser.parse_args()
+
+    documents = iter_documents(films=args.films, persons=args.persons, genres=args.genres, max_cast=args.max_cast,
+                               cast_skew=args.cast_skew, popularity_skew=args.popularity_skew, seed=args.seed)
+    if args.output == '-':
+        counts = write_bulk(documents, sys.stdout.buffer, check=args.check_schema)
+    else:
+        with open(args.output, 'wb') as output:
+            counts = write_bulk(documents, output, check=args.check_schema)
+    print(', '.join(f'{index}: {count}' for index, count in counts.items()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+Заглушки AsyncElasticsearch и aioredis.Redis для бенчмарков: данные в памяти, задержка сети
+задаётся параметром latency (секунды на вызов, pipeline/MULTI - один вызов).
+
+FakeElasticsearch понимает только запросы, которые строит этот сервис: match_all, match, multi_match,
+term, ids, nested, bool, сортировку, from/size, search_after и _source; на остальных - ValueError.
+Ответ проходит через orjson.dumps/loads, чтобы учесть разбор JSON, как у настоящего клиента.
+"""
+import asyncio
+import functools
+import random
+from typing import Any, Dict, Iterable, List, Optional
+
+import elasticsearch
+import orjson
+
+
+class Latency:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+
+    async def wait(self) -> None:
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+        # sleep(0) всё равно отдаёт управление event loop, как и настоящий сетевой вызов
+        await asyncio.sleep(delay)
+
+
+def _path_values(doc: Any, path: str) -> List[Any]:
+    values = [doc]
+    for part in path.split('.'):
+        next_values = []
+        for value in values:
+            value = value.get(part) if isinstance(value, dict) else None
+            if isinstance(value, list):
+                next_values.extend(value)
+            elif value is not None:
+                next_values.append(value)
+        values = next_values
+    return values
+
+
+def _tokens(value: Any) -> set:
+    return set(str(value).lower().split())
+
+
+def _text_matches(doc: dict, fields: Iterable[str], text: str) -> bool:
+    wanted = _tokens(text)
+    return any(wanted & _tokens(value) for field in fields for value in _path_values(doc, field.split('^')[0]))
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    if not query:
+        return True
+    (kind, params), = query.items()
+    if kind == 'match_all':
+        return True
+    if kind == 'match':
+        (field, text), = params.items()
+        return _text_matches(doc, [field], text['query'] if isinstance(text, dict) else text)
+    if kind == 'multi_match':
+        return _text_matches(doc, params['fields'], params['query'])
+    if kind == 'term':
+        (field, value), = params.items()
+        value = value['value'] if isinstance(value, dict) else value
+        return value in _path_values(doc, field)
+    if kind == 'ids':
+        return doc['id'] in params['values']
+    if kind == 'nested':
+        return matches(doc, params['query'])
+    if kind == 'bool':
+        required = _as_list(params.get('must')) + _as_list(params.get('filter'))
+        should = _as_list(params.get('should'))
+        if not all(matches(doc, clause) for clause in required):
+            return False
+        return bool(required) or not should or any(matches(doc, clause) for clause in should)
+    raise ValueError(f'FakeElasticsearch does not support the {kind!r} query clause: {params!r}')
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _project(source: dict, spec: Any) -> dict:
+    if spec is None or spec is True:
+        return source
+    if isinstance(spec, str):
+        spec = [spec]
+    if isinstance(spec, list):
+        return {key: value for key, value in source.items() if key in spec}
+    includes, excludes = spec.get('includes'), spec.get('excludes', [])
+    return {key: value for key, value in source.items()
+            if (not includes or key in includes) and key not in excludes}
+
+
+def _sort_specs(sort: List[Any]) -> List[tuple]:
+    specs = []
+    for spec in sort:
+        if isinstance(spec, str):
+            specs.append((spec.lstrip('-'), 'desc' if spec.startswith('-') else 'asc'))
+        else:
+            (field, order), = spec.items()
+            specs.append((field, order['order'] if isinstance(order, dict) else order))
+    return specs
+
+
+def _sort_values(doc: dict, specs: List[tuple]) -> List[Any]:
+    return [1.0 if field == '_score' else doc.get(field) for field, _ in specs]
+
+
+def _compare(left: List[Any], right: List[Any], specs: List[tuple]) -> int:
+    for a, b, (_, order) in zip(left, right, specs):
+        if a == b:
+            continue
+        # Отсутствующее значение всегда в конце, как missing: _last в elastic
+        if a is None or b is None:
+            return 1 if a is None else -1
+        result = -1 if a < b else 1
+        return -result if order == 'desc' else result
+    return 0
+
+
+class FakeElasticsearch:
+    def __init__(self, catalog: Dict[str, Dict[str, dict]], latency: Optional[Latency] = None) -> None:
+        self.catalog = catalog
+        self.latency = latency or Latency()
+        self.calls = 0
+        # Отфильтрованные и отсортированные документы по запросу без from/size: иначе перебор каталога
+        # на Python стоил бы больше, чем сам сервис, и искажал бы замеры
+        self._matched: Dict[bytes, List[dict]] = {}
+
+    @staticmethod
+    def _response(data: Any) -> Any:
+        return orjson.loads(orjson.dumps(data))
+
+    async def get(self, index: str, id: str, **kwargs) -> dict:
+        await self.latency.wait()
+        self.calls += 1
+        doc = self.catalog[index].get(id)
+        if doc is None:
+            raise elasticsearch.exceptions.NotFoundError(404, 'not_found', {'_id': id, 'found': False})
+        return self._response({'_index': index, '_id': id, 'found': True, '_source': doc})
+
+    async def mget(self, body: dict, index: str, _source_includes: Optional[List[str]] = None, **kwargs) -> dict:
+        await self.latency.wait()
+        self.calls += 1
+        docs = []
+        for doc_id in body['ids']:
+            doc = self.catalog[index].get(doc_id)
+            if doc is None:
+                docs.append({'_index': index, '_id': doc_id, 'found': False})
+            else:
+                docs.append({'_index': index, '_id': doc_id, 'found': True, '_source': _project(doc, _source_includes)})
+        return self._response({'docs': docs})
+
+    async def search(self, index: str, body: dict, **kwargs) -> dict:
+        await self.latency.wait()
+        self.calls += 1
+        query = body.get('query')
+        specs = _sort_specs(body.get('sort', []))
+        docs = self._match(index, query, specs)
+        if specs:
+            if 'search_after' in body:
+                after = body['search_after']
+                docs = [doc for doc in docs if _compare(_sort_values(doc, specs), after, specs) > 0]
+        start = body.get('from', 0)
+        hits = []
+        for doc in docs[start:start + body.get('size', 10)]:
+            hit = {'_index': index, '_id': doc['id'], '_score': 1.0, '_source': _project(doc, body.get('_source'))}
+            if specs:
+                hit['sort'] = _sort_values(doc, specs)
+            hits.append(hit)
+        return self._response({'hits': {'total': {'value': len(docs), 'relation': 'eq'}, 'hits': hits}})
+
+    def _match(self, index: str, query: Optional[dict], specs: List[tuple]) -> List[dict]:
+        key = orjson.dumps([index, query, specs])
+        docs = self._matched.get(key)
+        if docs is None:
+            docs = [doc for doc in self.catalog[index].values() if matches(doc, query)]
+            if specs:
+                docs.sort(key=functools.cmp_to_key(
+                    lambda a, b: _compare(_sort_values(a, specs), _sort_values(b, specs), specs)))
+            self._matched[key] = docs
+        return docs
+
+    async def close(self) -> None:
+        pass
+
+
+class _FakePipeline:
+    def __init__(self, redis: 'FakeRedis') -> None:
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name: str):
+        def command(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+        return command
+
+    async def execute(self) -> List[Any]:
+        await self._redis.latency.wait()
+        self._redis.calls += 1
+        return [getattr(self._redis, f'_{name}')(*args, **kwargs) for name, args, kwargs in self._commands]
+
+
+class FakeRedis:
+    # Только команды, которые использует RedisCacheStorage; TTL не соблюдается
+    def __init__(self, latency: Optional[Latency] = None) -> None:
+        self.latency = latency or Latency()
+        self.data: Dict[str, bytes] = {}
+        self.sets: Dict[str, Dict[str, float]] = {}
+        self.calls = 0
+        self.closed = False
+
+    async def _call(self, name: str, *args, **kwargs) -> Any:
+        await self.latency.wait()
+        self.calls += 1
+        return getattr(self, f'_{name}')(*args, **kwargs)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        return self.data.get(key)
+
+    def _set(self, key: str, value: Any, expire: int = 0) -> bool:
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def _setex(self, key: str, seconds: int, value: Any) -> bool:
+        return self._set(key, value)
+
+    def _mget(self, *keys: str) -> List[Optional[bytes]]:
+        return [self.data.get(key) for key in keys]
+
+    def _delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None or self.sets.pop(key, None) is not None for key in keys)
+
+    def _zadd(self, key: str, *pairs: Any) -> int:
+        self.sets.setdefault(key, {}).update(zip(pairs[1::2], pairs[::2]))
+        return len(pairs) // 2
+
+    def _zremrangebyscore(self, key: str, min: float = float('-inf'), max: float = float('inf')) -> int:
+        members = self.sets.get(key, {})
+        expired = [member for member, score in members.items() if min <= score <= max]
+        for member in expired:
+            del members[member]
+        return len(expired)
+
+    def _zrangebyscore(self, key: str, min: float = float('-inf'), max: float = float('inf'),
+                       encoding: Optional[str] = None) -> List[str]:
+        return [member for member, score in self.sets.get(key, {}).items() if min <= score <= max]
+
+    def _expire(self, key: str, seconds: int) -> bool:
+        return True
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._call('get', key)
+
+    async def set(self, key: str, value: Any, expire: int = 0) -> bool:
+        return await self._call('set', key, value, expire)
+
+    async def mget(self, *keys: str) -> List[Optional[bytes]]:
+        return await self._call('mget', *keys)
+
+    async def delete(self, *keys: str) -> int:
+        return await self._call('delete', *keys)
+
+    def pipeline(self) -> _FakePipeline:
+        return _FakePipeline(self)
+
+    def multi_exec(self) -> _FakePipeline:
+        return _FakePipeline(self)
+
+    async def publish(self, channel: str, message: bytes) -> int:
+        await self.latency.wait()
+        return 0
+
+    def close(self) -> None:
+        self.closed = True
+
+    async def wait_closed(self) -> None:
+        pass
@@ -0,0 +1,34 @@
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request, Response, status
+from fastapi.responses import ORJSONResponse
+
+import config
+from db.cache import CacheEntry
+from timing import phase
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def cache_headers(entry: CacheEntry) -> Dict[str, str]:
+    # max-age - оставшаяся свежесть записи в нашем кэше, дальше edge может отдавать устаревшее,
+    # пока мы сами обновляем запись в фоне
+    max_age = max(0, int(entry.expire_at - time.time()))
+    return {
+        'ETag': f'"{entry.etag}"',
+        'Cache-Control': f'public, max-age={max_age}, stale-while-revalidate={config.CACHE_STALE_TTL}',
+    }
+
+
+def conditional_response(request: Request, entry: CacheEntry, build_payload: Callable[[Any], Any]) -> Response:
+    headers = cache_headers(entry)
+    if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    with phase('serialize'):
+        return ORJSONResponse(build_payload(entry.value), headers=headers)
@@ -1,3 +1,8 @@
 FILM_NOT_FOUND = 'film not found'
 GENRE_NOT_FOUND = 'genre not found'
 PERSON_NOT_FOUND = 'person not found'
+PAGE_OUT_OF_RANGE = 'page is out of range'
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+CURSOR_DESCRIPTION = ('Курсор для постраничного обхода через search_after: пустое значение начинает обход, '
+                      f'следующий курсор возвращается в заголовке {NEXT_CURSOR_HEADER}')
@@ -2,10 +2,16 @@ from typing import List, Optional
 from uuid import UUID
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
-from api_v1.constants import FILM_NOT_FOUND
+import config
+import db.models
+from api_v1.conditional import conditional_response
+from api_v1.constants import CURSOR_DESCRIPTION, FILM_NOT_FOUND, NEXT_CURSOR_HEADER
 from api_v1.models import FilmShort, FilmDetails
+from api_v1.responses import list_response
+from api_v1.streaming import ndjson_response
 from services.film import FilmService, get_film_service
 
 logger = logging.getLogger(__name__)
@@ -13,12 +19,13 @@ router = APIRouter()
 
 
 @router.get('/{film_id:uuid}', response_model=FilmDetails)
-async def film_details(film_id: UUID, film_service: FilmService = Depends(get_film_service)) -> FilmDetails:
-    film = await film_service.get_by_id(str(film_id))
-    if not film:
+async def film_details(film_id: UUID, request: Request,
+                       film_service: FilmService = Depends(get_film_service)) -> Response:
+    entry = await film_service.get_entry_by_id(str(film_id))
+    if not entry:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=FILM_NOT_FOUND)
 
-    return FilmDetails.from_db_model(film)
+    return conditional_response(request, entry, FilmDetails.payload_from_db_model)
 
 
 @router.get('/', response_model=List[FilmShort])
@@ -28,13 +35,34 @@ async def film_search(
         sort: Optional[str] = Query(None, regex='^-?[a-zA-Z_]+$'),
         page_number: int = Query(1, alias='page[number]', gt=0),
         page_size: int = Query(50, alias='page[size]', gt=0),
+        cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+
+        film_service: FilmService = Depends(get_film_service)) -> ORJSONResponse:
+    if cursor is not None:
+        films, next_cursor = await film_service.search_by_cursor(
+            search_query=query,
+            sort=sort,
+            search_filter=str(filter_genre) if filter_genre else None, page_size=page_size, cursor=cursor,
+            projection=db.models.FilmShort)
+        response = list_response(films, FilmShort.payload_from_db_model)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return response
 
-        film_service: FilmService = Depends(get_film_service)) -> List[FilmShort]:
     films = await film_service.search(
         search_query=query,
         sort=sort,
-        search_filter=str(filter_genre) if filter_genre else None, page_size=page_size, page_number=page_number)
+        search_filter=str(filter_genre) if filter_genre else None, page_size=page_size, page_number=page_number,
+        projection=db.models.FilmShort)
     if not films:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=FILM_NOT_FOUND)
 
-    return [FilmShort.from_db_model(film) for film in films]
+    return list_response(films, FilmShort.payload_from_db_model)
+
+
+@router.get('/export', response_class=StreamingResponse,
+            description='Выгрузка всего индекса movies в NDJSON по point-in-time снимку')
+async def film_export(
+        batch_size: int = Query(config.EXPORT_BATCH_SIZE, gt=0, le=10000),
+        film_service: FilmService = Depends(get_film_service)) -> StreamingResponse:
+    return ndjson_response(film_service.export(batch_size=batch_size))
@@ -2,10 +2,16 @@ import logging
 from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
-from api_v1.constants import GENRE_NOT_FOUND
+import config
+import db.models
+from api_v1.conditional import conditional_response
+from api_v1.constants import CURSOR_DESCRIPTION, GENRE_NOT_FOUND, NEXT_CURSOR_HEADER, PAGE_OUT_OF_RANGE
 from api_v1.models import GenreDetail, Genre
+from api_v1.responses import list_response
+from api_v1.streaming import ndjson_response
 from services.genre import GenreService, get_genre_service
 
 logger = logging.getLogger(__name__)
@@ -18,23 +24,50 @@ async def genres_all(
         sort: Optional[str] = Query(None, regex='^-?[a-zA-Z_]+$'),
         page_number: int = Query(1, alias='page[number]'),
         page_size: int = Query(50, alias='page[size]'),
-        genre_service: GenreService = Depends(get_genre_service)) -> List[Genre]:
+        cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+        genre_service: GenreService = Depends(get_genre_service)) -> ORJSONResponse:
+    if cursor is not None:
+        genres, next_cursor = await genre_service.search_by_cursor(
+            search_query=query,
+            sort=sort,
+            page_size=page_size, cursor=cursor,
+            projection=db.models.GenreShort)
+        response = list_response(genres, Genre.payload_from_db_model)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return response
+
     genres = await genre_service.search(
         search_query=query,
         sort=sort,
-        page_size=page_size, page_number=page_number)
+        page_size=page_size, page_number=page_number,
+        projection=db.models.GenreShort)
     if not genres:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=GENRE_NOT_FOUND)
 
-    return [Genre.from_db_model(genre) for genre in genres]
+    return list_response(genres, Genre.payload_from_db_model)
 
 
 @router.get('/{genre_id:uuid}', response_model=GenreDetail)
 async def genre_detail(
         genre_id: UUID,
-        genre_service=Depends(get_genre_service)
-) -> GenreDetail:
-    genre = await genre_service.get_by_id(str(genre_id))
-    if not genre:
+        request: Request,
+        page_number: int = Query(1, alias='page[number]', gt=0),
+        page_size: int = Query(50, alias='page[size]', gt=0, le=100),
+        genre_service: GenreService = Depends(get_genre_service)
+) -> Response:
+    # Пагинация относится к filmworks, общее число фильмов жанра - в filmworks_total
+    if page_number * page_size > config.ES_MAX_RESULT_WINDOW:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=PAGE_OUT_OF_RANGE)
+    entry = await genre_service.get_entry_by_page(str(genre_id), page_number, page_size)
+    if not entry:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=GENRE_NOT_FOUND)
-    return GenreDetail.from_db_model(genre)
+    return conditional_response(request, entry, GenreDetail.payload_from_db_model)
+
+
+@router.get('/export', response_class=StreamingResponse,
+            description='Выгрузка всего индекса genres в NDJSON по point-in-time снимку')
+async def genre_export(
+        batch_size: int = Query(config.EXPORT_BATCH_SIZE, gt=0, le=10000),
+        genre_service: GenreService = Depends(get_genre_service)) -> StreamingResponse:
+    return ndjson_response(genre_service.export(batch_size=batch_size))
@@ -1,3 +1,4 @@
+from abc import abstractmethod
 from typing import List, Optional, Union
 
 import orjson
@@ -17,6 +18,17 @@ class APIModel(BaseModel):
         json_loads = orjson.loads
         json_dumps = orjson_dumps
 
+    # payload_from_db_model собирает ответ сразу в dict, без создания и повторной валидации
+    # pydantic-моделей: ручки отдают его через ORJSONResponse. from_db_model строится поверх него.
+    # Метакласс pydantic-моделей - ABCMeta, поэтому модель без своего payload_from_db_model не создаётся
+    @classmethod
+    @abstractmethod
+    def payload_from_db_model(cls, obj) -> dict: ...
+
+    @classmethod
+    def from_db_model(cls, obj):
+        return cls(**cls.payload_from_db_model(obj))
+
 
 class Person(APIModel):
     uuid: str
@@ -25,27 +37,31 @@ class Person(APIModel):
     film_ids: List[str]
 
     @classmethod
-    def from_db_model(cls, person: db.models.Person):
-        return cls(
-            uuid=person.id,
-            full_name=person.full_name,
-            roles=person.roles,
-            film_ids=person.film_ids
-        )
+    def payload_from_db_model(cls, person: db.models.Person) -> dict:
+        return {
+            'uuid': person.id,
+            'full_name': person.full_name,
+            'roles': person.roles,
+            'film_ids': person.film_ids,
+        }
 
 
 class PersonShort(APIModel):
     uuid: str
     full_name: str
 
+    @classmethod
+    def payload_from_db_model(cls, person: db.models.IdName) -> dict:
+        return {'uuid': person.id, 'full_name': person.name}
+
 
 class Genre(APIModel):
     uuid: str
     name: str
 
     @classmethod
-    def from_db_model(cls, genre: db.models.Genre):
-        return cls(uuid=genre.id, name=genre.name)
+    def payload_from_db_model(cls, genre: Union[db.models.GenreShort, db.models.Genre, db.models.IdName]) -> dict:
+        return {'uuid': genre.id, 'name': genre.name}
 
 
 class FilmShort(APIModel):
@@ -54,26 +70,24 @@ class FilmShort(APIModel):
     imdb_rating: Optional[float]
 
     @classmethod
-    def from_db_model(cls, film: Union[db.models.FilmShort, db.models.Film]):
-        return cls(
-            uuid=film.id,
-            title=film.title,
-            imdb_rating=film.imdb_rating
-        )
+    def payload_from_db_model(cls, film: Union[db.models.FilmShort, db.models.Film]) -> dict:
+        return {'uuid': film.id, 'title': film.title, 'imdb_rating': film.imdb_rating}
 
 
 class GenreDetail(APIModel):
     uuid: str
     name: str
     filmworks: List[FilmShort]
+    filmworks_total: int
 
     @classmethod
-    def from_db_model(cls, genre: db.models.Genre):
-        return cls(
-            uuid=genre.id,
-            name=genre.name,
-            filmworks=[FilmShort.from_db_model(film) for film in genre.filmworks]
-        )
+    def payload_from_db_model(cls, genre: db.models.GenrePage) -> dict:
+        return {
+            'uuid': genre.id,
+            'name': genre.name,
+            'filmworks': [FilmShort.payload_from_db_model(film) for film in genre.filmworks],
+            'filmworks_total': genre.filmworks_total,
+        }
 
 
 class FilmDetails(APIModel):
@@ -87,14 +101,14 @@ class FilmDetails(APIModel):
     directors: List[PersonShort]
 
     @classmethod
-    def from_db_model(cls, film: db.models.Film):
-        return cls(
-            uuid=film.id,
-            title=film.title,
-            imdb_rating=film.imdb_rating,
-            description=film.description,
-            genre=[Genre(uuid=genre.id, name=genre.name) for genre in film.genres],
-            actors=[PersonShort(uuid=person.id, full_name=person.name) for person in film.actors],
-            writers=[PersonShort(uuid=person.id, full_name=person.name) for person in film.writers],
-            directors=[PersonShort(uuid=person.id, full_name=person.name) for person in film.directors]
-        )
+    def payload_from_db_model(cls, film: db.models.Film) -> dict:
+        return {
+            'uuid': film.id,
+            'title': film.title,
+            'imdb_rating': film.imdb_rating,
+            'description': film.description,
+            'genre': [Genre.payload_from_db_model(genre) for genre in film.genres],
+            'actors': [PersonShort.payload_from_db_model(person) for person in film.actors],
+            'writers': [PersonShort.payload_from_db_model(person) for person in film.writers],
+            'directors': [PersonShort.payload_from_db_model(person) for person in film.directors],
+        }
@@ -2,11 +2,15 @@ from typing import List, Optional
 from uuid import UUID
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
-from api_v1.constants import PERSON_NOT_FOUND, FILM_NOT_FOUND
+import config
+from api_v1.conditional import conditional_response
+from api_v1.constants import CURSOR_DESCRIPTION, FILM_NOT_FOUND, NEXT_CURSOR_HEADER, PERSON_NOT_FOUND
 from api_v1.models import FilmShort, Person
-from services.film import FilmService, get_film_service
+from api_v1.responses import list_response
+from api_v1.streaming import ndjson_response
 from services.person import PersonService, get_person_service
 
 logger = logging.getLogger(__name__)
@@ -14,13 +18,13 @@ router = APIRouter()
 
 
 @router.get('/{person_id:uuid}', response_model=Person)
-async def person_details(person_id: UUID,
-                         person_service: PersonService = Depends(get_person_service)) -> Person:
-    person = await person_service.get_by_id(str(person_id))
-    if not person:
+async def person_details(person_id: UUID, request: Request,
+                         person_service: PersonService = Depends(get_person_service)) -> Response:
+    entry = await person_service.get_entry_by_id(str(person_id))
+    if not entry:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PERSON_NOT_FOUND)
 
-    return Person.from_db_model(person)
+    return conditional_response(request, entry, Person.payload_from_db_model)
 
 
 @router.get('/', response_model=List[Person])
@@ -29,7 +33,18 @@ async def person_search(
         sort: Optional[str] = Query(None, regex='^-?[a-zA-Z_]+$'),
         page_number: int = Query(1, alias='page[number]', gt=0),
         page_size: int = Query(50, alias='page[size]', gt=0),
-        person_service: PersonService = Depends(get_person_service)) -> List[Person]:
+        cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+        person_service: PersonService = Depends(get_person_service)) -> ORJSONResponse:
+    if cursor is not None:
+        persons, next_cursor = await person_service.search_by_cursor(
+            search_query=query,
+            sort=sort,
+            page_size=page_size, cursor=cursor)
+        response = list_response(persons, Person.payload_from_db_model)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return response
+
     persons = await person_service.search(
         search_query=query,
         sort=sort,
@@ -37,17 +52,25 @@ async def person_search(
     if not persons:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PERSON_NOT_FOUND)
 
-    return [Person.from_db_model(person) for person in persons]
+    return list_response(persons, Person.payload_from_db_model)
 
 
 @router.get('/{person_id:uuid}/film', response_model=List[FilmShort])
 async def person_films(
         person_id: UUID,
-        person_service: PersonService = Depends(get_person_service),
-        film_service: FilmService = Depends(get_film_service)) -> List[FilmShort]:
-    person = await person_service.get_by_id(str(person_id))
-    person_films = await film_service.bulk_get_by_ids(person.film_ids)
+        person_service: PersonService = Depends(get_person_service)) -> ORJSONResponse:
+    person_films = await person_service.get_filmography(str(person_id))
+    if person_films is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=PERSON_NOT_FOUND)
     if not person_films:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=FILM_NOT_FOUND)
 
-    return [FilmShort.from_db_model(film) for film in person_films]
+    return list_response(person_films, FilmShort.payload_from_db_model)
+
+
+@router.get('/export', response_class=StreamingResponse,
+            description='Выгрузка всего индекса persons в NDJSON по point-in-time снимку')
+async def person_export(
+        batch_size: int = Query(config.EXPORT_BATCH_SIZE, gt=0, le=10000),
+        person_service: PersonService = Depends(get_person_service)) -> StreamingResponse:
+    return ndjson_response(person_service.export(batch_size=batch_size))
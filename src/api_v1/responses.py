@@ -0,0 +1,10 @@
+from typing import Any, Callable, Iterable
+
+from fastapi.responses import ORJSONResponse
+
+from timing import phase
+
+
+def list_response(items: Iterable[Any], build_payload: Callable[[Any], Any]) -> ORJSONResponse:
+    with phase('serialize'):
+        return ORJSONResponse([build_payload(item) for item in items])
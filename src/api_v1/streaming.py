@@ -0,0 +1,16 @@
+from typing import AsyncIterator, List
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+async def ndjson_chunks(batches: AsyncIterator[List[dict]]) -> AsyncIterator[bytes]:
+    # Каждая пачка сериализуется сразу по приходу, в памяти не больше одной пачки
+    async for batch in batches:
+        yield b''.join([orjson.dumps(doc) + b'\n' for doc in batch])
+
+
+def ndjson_response(batches: AsyncIterator[List[dict]]) -> StreamingResponse:
+    return StreamingResponse(ndjson_chunks(batches), media_type=NDJSON_MEDIA_TYPE)
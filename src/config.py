@@ -7,10 +7,90 @@ PROJECT_NAME = os.getenv('PROJECT_NAME', 'Films API')
 # Настройки Redis
 REDIS_HOST = os.getenv('REDIS_HOST', '127.0.0.1')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
-CACHE_TTL = 60 * 5
+# Несколько узлов через запятую (host:port): ключи кэша шардируются между ними консистентным хэшированием
+REDIS_NODES = [(host, int(port)) for host, port in (
+    node.rsplit(':', 1) for node in os.getenv('REDIS_NODES', f'{REDIS_HOST}:{REDIS_PORT}').split(','))]
+# Sentinel (host:port через запятую) вместо прямого подключения; REDIS_NODES тогда не используется
+REDIS_SENTINELS = [(host, int(port)) for host, port in (
+    node.rsplit(':', 1) for node in os.getenv('REDIS_SENTINELS', '').split(',') if node)]
+REDIS_SENTINEL_MASTER = os.getenv('REDIS_SENTINEL_MASTER', 'mymaster')
+REDIS_POOL_MINSIZE = int(os.getenv('REDIS_POOL_MINSIZE', 10))
+REDIS_POOL_MAXSIZE = int(os.getenv('REDIS_POOL_MAXSIZE', 20))
+# Склеивать одновременные GET-запросы к кэшу в один MGET
+REDIS_AUTO_PIPELINE = os.getenv('REDIS_AUTO_PIPELINE', 'false').lower() in ('1', 'true', 'yes')
+# Через CACHE_TTL запись считается устаревшей и обновляется в фоне,
+# ещё CACHE_STALE_TTL секунд её можно отдавать клиентам
+CACHE_TTL = int(os.getenv('CACHE_TTL', 60 * 5))
+CACHE_STALE_TTL = int(os.getenv('CACHE_STALE_TTL', 60 * 5))
+# Канал pub/sub, в который индексатор публикует изменённые документы: {"index": "movies", "ids": [...]}.
+# Записи кэша с этими документами удаляются сразу, поэтому CACHE_TTL может быть большим. Каждая запись поиска
+# добавляет по команде в Redis на каждый найденный документ, поэтому включать, только если индексатор публикует
+CACHE_INVALIDATION_ENABLED = os.getenv('CACHE_INVALIDATION_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL', 'cache:invalidate')
+# TTL записей об отсутствии: несуществующие id и пустые результаты поиска
+NEGATIVE_CACHE_TTL = int(os.getenv('NEGATIVE_CACHE_TTL', 30))
+
+# Формат значений в Redis: сериализатор json|msgpack и сжатие none|zlib|zstd|lz4 значений длиннее порога (байт).
+# msgpack, zstd и lz4 требуют пакетов msgpack, zstandard и lz4 из requirements.txt; без них используются json и zlib
+CACHE_SERIALIZER = os.getenv('CACHE_SERIALIZER', 'json')
+CACHE_COMPRESSION = os.getenv('CACHE_COMPRESSION', 'zlib')
+CACHE_COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', 1024))
+
+# Настройки in-process кэша (L1) перед Redis
+LOCAL_CACHE_SIZE = int(os.getenv('LOCAL_CACHE_SIZE', 1000))
+LOCAL_CACHE_TTL = int(os.getenv('LOCAL_CACHE_TTL', 10))
+
+# Кэш готовых ответов API целиком (байты ответа по пути и query-параметрам), по умолчанию выключен
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 60))
+RESPONSE_CACHE_PREFIX = '/v1/'
+
+# Заголовок Server-Timing с разбивкой времени запроса по фазам (query, redis, es, parse, serialize).
+# С заголовком X-Debug-Token, равным SERVER_TIMING_DEBUG_TOKEN, замер включается для отдельного запроса
+# и дополнительно отдаётся JSON в заголовке X-Debug-Timing
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SERVER_TIMING_DEBUG_TOKEN = os.getenv('SERVER_TIMING_DEBUG_TOKEN', '')
 
 # Настройки Elasticsearch
 ES_URL = os.getenv('ES_URL', 'http://127.0.0.1:9200')
+# Несколько узлов через запятую, по умолчанию один ES_URL
+ES_HOSTS = os.getenv('ES_HOSTS', ES_URL).split(',')
+# Размер пула соединений к каждому узлу и сколько секунд держать простаивающее соединение открытым
+ES_POOL_SIZE = int(os.getenv('ES_POOL_SIZE', 20))
+ES_KEEPALIVE = float(os.getenv('ES_KEEPALIVE', 30))
+# Таймаут одного запроса (секунды); повтор на таймауте не больше ES_MAX_RETRIES раз,
+# так что запрос занимает не дольше ES_TIMEOUT * (ES_MAX_RETRIES + 1)
+ES_TIMEOUT = float(os.getenv('ES_TIMEOUT', 5))
+ES_MAX_RETRIES = int(os.getenv('ES_MAX_RETRIES', 1))
+ES_RETRY_ON_TIMEOUT = os.getenv('ES_RETRY_ON_TIMEOUT', 'true').lower() in ('1', 'true', 'yes')
+# Обнаружение узлов кластера при старте и затем раз в ES_SNIFFER_TIMEOUT секунд (0 - выключено)
+ES_SNIFF_ON_START = os.getenv('ES_SNIFF_ON_START', 'false').lower() in ('1', 'true', 'yes')
+ES_SNIFFER_TIMEOUT = float(os.getenv('ES_SNIFFER_TIMEOUT', 0)) or None
+
+# index.max_result_window индексов: from + size одного поиска не может быть больше
+ES_MAX_RESULT_WINDOW = int(os.getenv('ES_MAX_RESULT_WINDOW', 10000))
+
+# Выгрузка индексов в NDJSON: размер пачки и время жизни point-in-time между пачками
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+EXPORT_KEEP_ALIVE = os.getenv('EXPORT_KEEP_ALIVE', '1m')
+
+# Прогрев кэша при старте: топ WARMUP_TOP_FILMS фильмов по рейтингу, все жанры (до WARMUP_MAX_GENRES)
+# и первые страницы поиска по умолчанию; не больше WARMUP_CONCURRENCY запросов к elastic одновременно
+WARMUP_ON_STARTUP = os.getenv('WARMUP_ON_STARTUP', 'false').lower() in ('1', 'true', 'yes')
+WARMUP_TOP_FILMS = int(os.getenv('WARMUP_TOP_FILMS', 1000))
+WARMUP_MAX_GENRES = int(os.getenv('WARMUP_MAX_GENRES', 1000))
+WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', 4))
+
+# ETL из Postgres в elastic: строки читаются серверным курсором пачками по ETL_FETCH_SIZE,
+# документы отправляются в _bulk пачками по ETL_CHUNK_SIZE из ETL_CONCURRENCY потоков;
+# в очереди между чтением и загрузкой не больше ETL_QUEUE_SIZE документов
+POSTGRES_DSN = os.getenv('POSTGRES_DSN', 'host={} port={} dbname={} user={} password={}'.format(
+    os.getenv('PG_HOST', '127.0.0.1'), os.getenv('PG_PORT', 5432), os.getenv('PG_DB', 'postgres'),
+    os.getenv('PG_USER', 'postgres'), os.getenv('PG_PASS', '')))
+ETL_FETCH_SIZE = int(os.getenv('ETL_FETCH_SIZE', 5000))
+ETL_CHUNK_SIZE = int(os.getenv('ETL_CHUNK_SIZE', 1000))
+ETL_CONCURRENCY = int(os.getenv('ETL_CONCURRENCY', 4))
+ETL_QUEUE_SIZE = int(os.getenv('ETL_QUEUE_SIZE', 10000))
 
 # Корень проекта
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -1,77 +1,700 @@
-import json
+import asyncio
+import bisect
+import functools
+import hashlib
 import logging
-from typing import List, Optional, Protocol, Type
+import re
+import time
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Protocol, Sequence, Tuple, Type
 
 import aioredis
+import orjson
 from aioredis import Redis
-from pydantic import BaseModel
-from pydantic.tools import parse_raw_as
+from prometheus_client import REGISTRY
+from pydantic import BaseModel, ValidationError, parse_obj_as
 
 import config
+from db.codecs import CacheCodec, CodecError, default_codec
+from metrics import CACHE_REQUESTS, REDIS_DURATION, LocalCacheCollector
+from timing import phase
 
 logger = logging.getLogger(__name__)
 
+MAX_AGE_RE = re.compile(rb'max-age=(\d+)')
+
 
 class AbstractCacheStorage(Protocol):
     async def get(self, key: str) -> Optional[str]: ...
 
-    async def set(self, key: str, value: str) -> None: ...
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None: ...
+
+    async def delete(self, *keys: str) -> None: ...
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]: ...
+
+    async def set_many(self, items: Dict[str, str], ttl: Optional[int] = None) -> None: ...
+
+    async def add_refs(self, refs: Dict[str, Dict[str, float]], ttl: Optional[int] = None) -> None: ...
+
+    async def pop_refs(self, keys: List[str]) -> List[List[str]]: ...
+
+    async def publish(self, channel: str, message: bytes) -> None: ...
+
+    def subscribe(self, channel: str) -> AsyncIterator[bytes]: ...
 
     async def close(self) -> None: ...
 
 
 class RedisCacheStorage(AbstractCacheStorage):
-    def __init__(self, redis: Redis, ttl: int = 60 * 5) -> None:
+    def __init__(self, redis: Redis, ttl: int = 60 * 5, auto_pipeline: bool = False) -> None:
         self._redis = redis
         self._ttl = ttl
+        # auto_pipeline: GET-ы, пришедшие за один тик event loop, уходят в Redis одним MGET
+        self._auto_pipeline = auto_pipeline
+        self._pending_gets: Dict[str, asyncio.Future] = {}
 
     async def close(self) -> None:
-        await self._redis.close()
+        self._redis.close()
+        await self._redis.wait_closed()
 
     async def get(self, key: str) -> Optional[str]:
         logger.debug(f"Trying to get from cache {key=}")
-        data = await self._redis.get(key)
+        if self._auto_pipeline:
+            return await self._pipelined_get(key)
+        with REDIS_DURATION.labels('get').time(), phase('redis'):
+            data = await self._redis.get(key)
         return data
 
-    async def set(self, key: str, value: str) -> None:
+    def _pipelined_get(self, key: str) -> asyncio.Future:
+        future = self._pending_gets.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            if not self._pending_gets:
+                loop.call_soon(self._flush_gets)
+            future = self._pending_gets[key] = loop.create_future()
+        return future
+
+    def _flush_gets(self) -> None:
+        batch, self._pending_gets = self._pending_gets, {}
+        asyncio.ensure_future(self._resolve_gets(batch))
+
+    async def _resolve_gets(self, batch: Dict[str, asyncio.Future]) -> None:
+        try:
+            values = await self.get_many(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, value in zip(batch.values(), values):
+            if not future.done():
+                future.set_result(value)
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
         logger.debug(f"Set cache with {key=}")
-        await self._redis.set(key, value, expire=self._ttl)
+        with REDIS_DURATION.labels('set').time(), phase('redis'):
+            await self._redis.set(key, value, expire=ttl or self._ttl)
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            logger.debug(f"Delete from cache {keys=}")
+            with REDIS_DURATION.labels('delete').time(), phase('redis'):
+                await self._redis.delete(*keys)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        logger.debug(f"Trying to get many from cache, {len(keys)} keys")
+        with REDIS_DURATION.labels('mget').time(), phase('redis'):
+            return await self._redis.mget(*keys)
+
+    async def set_many(self, items: Dict[str, str], ttl: Optional[int] = None) -> None:
+        if not items:
+            return
+        logger.debug(f"Set cache with {len(items)} keys")
+        pipe = self._redis.pipeline()
+        for key, value in items.items():
+            pipe.setex(key, ttl or self._ttl, value)
+        with REDIS_DURATION.labels('set_many').time(), phase('redis'):
+            await pipe.execute()
+
+    async def add_refs(self, refs: Dict[str, Dict[str, float]], ttl: Optional[int] = None) -> None:
+        # refs: ключ sorted set -> {ключ записи: момент её удаления из Redis}. Участники с истёкшей записью
+        # вычищаются при каждой записи, поэтому множество горячего документа не растёт бесконечно
+        if not refs:
+            return
+        now = time.time()
+        pipe = self._redis.pipeline()
+        for key, members in refs.items():
+            pipe.zadd(key, *[item for member, score in members.items() for item in (score, member)])
+            pipe.zremrangebyscore(key, max=now)
+            pipe.expire(key, ttl or self._ttl)
+        with REDIS_DURATION.labels('add_refs').time(), phase('redis'):
+            await pipe.execute()
+
+    async def pop_refs(self, keys: List[str]) -> List[List[str]]:
+        # Чтение и удаление в одной транзакции: параллельный pop того же множества получит пустой результат
+        if not keys:
+            return []
+        now = time.time()
+        transaction = self._redis.multi_exec()
+        for key in keys:
+            transaction.zrangebyscore(key, min=now, encoding='utf-8')
+            transaction.delete(key)
+        with REDIS_DURATION.labels('pop_refs').time(), phase('redis'):
+            results = await transaction.execute()
+        return results[::2]
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        await self._redis.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        receiver, = await self._redis.subscribe(channel)
+        try:
+            async for message in receiver.iter():
+                yield message
+        finally:
+            if not self._redis.closed:
+                await self._redis.unsubscribe(channel)
+
+
+class ShardedCacheStorage(AbstractCacheStorage):
+    # Ключи распределяются по узлам консистентным хэшированием: при добавлении узла
+    # переезжает только ~1/N ключей. Каждый узел представлен replicas точками на кольце.
+    def __init__(self, nodes: List[AbstractCacheStorage], replicas: int = 100) -> None:
+        if not nodes:
+            raise ValueError('At least one cache node is required')
+        self._nodes = nodes
+        ring = sorted((self._hash(f'{index}:{replica}'), index)
+                      for index in range(len(nodes)) for replica in range(replicas))
+        self._ring_hashes = [point for point, _ in ring]
+        self._ring_nodes = [index for _, index in ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+    def _node_index(self, key: str) -> int:
+        position = bisect.bisect(self._ring_hashes, self._hash(key)) % len(self._ring_hashes)
+        return self._ring_nodes[position]
+
+    def node_for(self, key: str) -> AbstractCacheStorage:
+        return self._nodes[self._node_index(key)]
+
+    def _group(self, keys: List[str]) -> Dict[int, List[str]]:
+        # Номер узла в self._nodes -> его ключи
+        groups: Dict[int, List[str]] = {}
+        for key in keys:
+            groups.setdefault(self._node_index(key), []).append(key)
+        return groups
+
+    async def close(self) -> None:
+        await asyncio.gather(*[node.close() for node in self._nodes])
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.node_for(key).get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        await self.node_for(key).set(key, value, ttl)
+
+    async def delete(self, *keys: str) -> None:
+        await asyncio.gather(*[self._nodes[index].delete(*node_keys)
+                               for index, node_keys in self._group(list(keys)).items()])
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        groups = self._group(keys)
+        results = await asyncio.gather(*[self._nodes[index].get_many(node_keys) for index, node_keys in groups.items()])
+        found = {}
+        for node_keys, values in zip(groups.values(), results):
+            found.update(zip(node_keys, values))
+        return [found[key] for key in keys]
+
+    async def set_many(self, items: Dict[str, str], ttl: Optional[int] = None) -> None:
+        await asyncio.gather(*[self._nodes[index].set_many({key: items[key] for key in node_keys}, ttl)
+                               for index, node_keys in self._group(list(items)).items()])
+
+    async def add_refs(self, refs: Dict[str, Dict[str, float]], ttl: Optional[int] = None) -> None:
+        await asyncio.gather(*[self._nodes[index].add_refs({key: refs[key] for key in node_keys}, ttl)
+                               for index, node_keys in self._group(list(refs)).items()])
+
+    async def pop_refs(self, keys: List[str]) -> List[List[str]]:
+        groups = self._group(keys)
+        results = await asyncio.gather(*[self._nodes[index].pop_refs(node_keys) for index, node_keys in groups.items()])
+        found = {}
+        for node_keys, members in zip(groups.values(), results):
+            found.update(zip(node_keys, members))
+        return [found[key] for key in keys]
+
+    # Pub/sub не шардируется: канал живёт на первом узле
+    async def publish(self, channel: str, message: bytes) -> None:
+        await self._nodes[0].publish(channel, message)
+
+    def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        return self._nodes[0].subscribe(channel)
+
+
+class LocalCache:
+    # In-process LRU с TTL. Хранит уже распарсенные объекты, чтобы горячие ключи
+    # не ходили в Redis и не десериализовались повторно.
+    def __init__(self, maxsize: int = 1000, ttl: float = 10) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expire_at, value = item
+        if expire_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+local_caches: Dict[str, LocalCache] = {}
+REGISTRY.register(LocalCacheCollector(local_caches))
+
+
+def get_local_cache(name: str) -> LocalCache:
+    if name not in local_caches:
+        local_caches[name] = LocalCache(maxsize=config.LOCAL_CACHE_SIZE, ttl=config.LOCAL_CACHE_TTL)
+    return local_caches[name]
+
+
+def content_hash(payload: Any) -> str:
+    return hashlib.blake2b(orjson.dumps(payload), digest_size=16).hexdigest()
+
+
+def query_fingerprint(query_elastic: dict) -> str:
+    # Ключи сортируются, поэтому одинаковые запросы дают одинаковый хэш независимо от порядка в dict
+    canonical = orjson.dumps(query_elastic, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+
+def id_key(model_name: str, instance_id: str) -> str:
+    return f'{model_name}:id:{instance_id}'
+
+
+def ref_key(instance_id: str) -> str:
+    # Ключи кэша, в которых есть документ instance_id: по ним записи вычищаются при изменении документа.
+    # Записи по id сюда не попадают, их ключ выводится из id
+    return f'refs:{instance_id}'
+
+
+def invalidate_local(keys: List[str]) -> None:
+    # L1 разбит по моделям, имя модели - первая часть ключа
+    for key in keys:
+        local_cache = local_caches.get(key.split(':', 1)[0])
+        if local_cache is not None:
+            local_cache.invalidate(key)
+
+
+class _NotFound:
+    def __repr__(self) -> str:
+        return 'NOT_FOUND'
+
+
+# Маркер закэшированного отсутствия: id нет в elastic или поиск ничего не нашёл
+NOT_FOUND = _NotFound()
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    # Момент "мягкого" устаревания (unix time). После него значение ещё отдаётся,
+    # но в фоне перезапрашивается; удаляет запись только TTL в хранилище.
+    expire_at: float
+    # Хэш содержимого, используется как ETag
+    etag: Optional[str] = None
+
+    @property
+    def is_stale(self) -> bool:
+        return self.expire_at < time.time()
 
 
 class ModelCache:
-    def __init__(self, model_class: Type[BaseModel], storage: AbstractCacheStorage):
+    def __init__(self, model_class: Type[BaseModel], storage: AbstractCacheStorage,
+                 local: Optional[LocalCache] = None, index: str = '',
+                 ttl: int = config.CACHE_TTL, stale_ttl: int = config.CACHE_STALE_TTL,
+                 negative_ttl: int = config.NEGATIVE_CACHE_TTL, codec: CacheCodec = default_codec,
+                 track_refs: bool = config.CACHE_INVALIDATION_ENABLED):
         self.model_class = model_class
         self.storage = storage
+        self.codec = codec
+        self.index = index
+        self.local = local if local is not None else get_local_cache(model_class.__name__)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        # Без инвалидации ссылки на документы никто не читает, и они не пишутся
+        self.track_refs = track_refs
+        self._refreshing: Dict[str, asyncio.Future] = {}
+        self._projections: Dict[Type[BaseModel], 'ModelCache'] = {}
+        self._requests = {result: CACHE_REQUESTS.labels(model_class.__name__, result)
+                          for result in ('hit', 'negative_hit', 'miss', 'error')}
 
-    async def get_by_id(self, film_id: str) -> Optional[BaseModel]:
-        key = f'{self.model_class.__name__}:id:{film_id}'
-        data = await self.storage.get(key)
-        if not data:
+    def for_model(self, model_class: Type[BaseModel]) -> 'ModelCache':
+        # Кэш для проекции модели (например FilmShort поверх Film) с теми же хранилищем и настройками
+        if model_class is self.model_class:
+            return self
+        if model_class not in self._projections:
+            self._projections[model_class] = ModelCache(
+                model_class, self.storage, index=self.index,
+                ttl=self.ttl, stale_ttl=self.stale_ttl, negative_ttl=self.negative_ttl, codec=self.codec,
+                track_refs=self.track_refs,
+            )
+        return self._projections[model_class]
+
+    def id_key(self, instance_id: str) -> str:
+        return id_key(self.model_class.__name__, instance_id)
+
+    def query_key(self, query_elastic: dict) -> str:
+        return f'{self.model_class.__name__}:query:{self.index}:{query_fingerprint(query_elastic)}'
+
+    def _new_entry(self, value: Any, payload: Any) -> CacheEntry:
+        return CacheEntry(value=value, expire_at=time.time() + self.ttl, etag=content_hash(payload))
+
+    def _new_not_found_entry(self) -> CacheEntry:
+        return CacheEntry(value=NOT_FOUND, expire_at=time.time() + self.negative_ttl)
+
+    def _encode(self, entry: CacheEntry, payload: Any) -> bytes:
+        return self.codec.encode({'e': entry.expire_at, 'h': entry.etag, 'v': payload})
+
+    def _encode_not_found(self, entry: CacheEntry) -> bytes:
+        return self.codec.encode({'e': entry.expire_at, 'n': 1})
+
+    def _decode(self, data: bytes, parse: Callable[[Any], Any]) -> Optional[CacheEntry]:
+        with phase('parse'):
+            return self._decode_envelope(data, parse)
+
+    def _decode_envelope(self, data: bytes, parse: Callable[[Any], Any]) -> Optional[CacheEntry]:
+        try:
+            envelope = self.codec.decode(data)
+            if envelope.get('n'):
+                return CacheEntry(value=NOT_FOUND, expire_at=envelope['e'])
+            etag = envelope.get('h') or content_hash(envelope['v'])
+            return CacheEntry(value=parse(envelope['v']), expire_at=envelope['e'], etag=etag)
+        except (CodecError, orjson.JSONDecodeError, AttributeError, TypeError, KeyError, ValidationError):
+            # Запись в старом/неизвестном формате считаем промахом
+            logger.warning('Unable to decode cache entry')
             return None
-        return self.model_class.parse_raw(data)
 
-    async def set_by_id(self, film_id: str, value: BaseModel) -> None:
-        key = f'{self.model_class.__name__}:id:{film_id}'
-        await self.storage.set(key=key, value=value.json())
+    def _parse_instance(self, payload: Any) -> BaseModel:
+        return self.model_class.parse_obj(payload)
+
+    def _parse_list(self, payload: Any) -> List[BaseModel]:
+        return parse_obj_as(List[self.model_class], payload)
+
+    async def _get_entry(self, key: str, parse: Callable[[Any], Any],
+                         refresh: Optional[Callable[[], Awaitable[Any]]]) -> Optional[CacheEntry]:
+        entry = self.local.get(key)
+        if entry is None:
+            try:
+                data = await self.storage.get(key)
+            except Exception:
+                self._requests['error'].inc()
+                raise
+            if not data:
+                self._requests['miss'].inc()
+                return None
+            entry = self._decode(data, parse)
+            if entry is None:
+                self._requests['error'].inc()
+                return None
+            self.local.set(key, entry)
+        self._count_hit(entry)
+        if refresh is not None and entry.is_stale:
+            self._refresh_in_background(key, refresh)
+        return entry
+
+    def _count_hit(self, entry: CacheEntry) -> None:
+        self._requests['negative_hit' if entry.value is NOT_FOUND else 'hit'].inc()
+
+    async def _set_entry(self, key: str, value: Any, payload: Any, ref_ids: List[str]) -> CacheEntry:
+        entry = self._new_entry(value, payload)
+        self.local.set(key, entry)
+        await asyncio.gather(
+            self.storage.set(key=key, value=self._encode(entry, payload), ttl=self.ttl + self.stale_ttl),
+            self._add_refs(key, ref_ids, self.ttl + self.stale_ttl),
+        )
+        return entry
+
+    async def _set_not_found(self, key: str, ref_ids: List[str]) -> CacheEntry:
+        entry = self._new_not_found_entry()
+        self.local.set(key, entry)
+        await asyncio.gather(
+            self.storage.set(key=key, value=self._encode_not_found(entry), ttl=self.negative_ttl),
+            self._add_refs(key, ref_ids, self.negative_ttl),
+        )
+        return entry
+
+    async def _add_refs(self, key: str, ref_ids: List[str], ttl: int) -> None:
+        if not (self.track_refs and ref_ids):
+            return
+        expire_at = time.time() + ttl
+        # Множество живёт не меньше самой долгой записи: более короткий TTL потерял бы ссылки
+        await self.storage.add_refs({ref_key(ref_id): {key: expire_at} for ref_id in ref_ids},
+                                    ttl=self.ttl + self.stale_ttl)
+
+    def _refresh_in_background(self, key: str, refresh: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+        logger.debug(f'Refreshing stale cache entry {key=}')
+        task = asyncio.ensure_future(refresh())
+        self._refreshing[key] = task
+        task.add_done_callback(functools.partial(self._on_refreshed, key))
+
+    def _on_refreshed(self, key: str, task: asyncio.Future) -> None:
+        self._refreshing.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f'Failed to refresh cache entry {key=}', exc_info=task.exception())
+
+    async def get_entry_by_id(self, instance_id: str,
+                              refresh: Optional[Callable[[], Awaitable[Any]]] = None) -> Optional[CacheEntry]:
+        return await self._get_entry(self.id_key(instance_id), self._parse_instance, refresh)
 
-    async def get_by_elastic_query(self, query_elastic: dict) -> Optional[List[BaseModel]]:
-        key = f'{self.model_class.__name__}:query:{str(query_elastic)}'
+    async def get_by_id(self, instance_id: str,
+                        refresh: Optional[Callable[[], Awaitable[Any]]] = None) -> Optional[BaseModel]:
+        entry = await self.get_entry_by_id(instance_id, refresh)
+        return entry.value if entry else None
+
+    async def set_by_id(self, instance_id: str, value: BaseModel) -> CacheEntry:
+        return await self._set_entry(self.id_key(instance_id), value, value.dict(), [])
+
+    async def set_not_found_by_id(self, instance_id: str) -> CacheEntry:
+        return await self._set_not_found(self.id_key(instance_id), [])
+
+    def page_key(self, instance_id: str, page_number: int, page_size: int) -> str:
+        return f'{self.model_class.__name__}:{instance_id}:page:{page_number}:{page_size}'
+
+    async def get_entry_by_page(self, instance_id: str, page_number: int, page_size: int,
+                                refresh: Optional[Callable[[], Awaitable[Any]]] = None) -> Optional[CacheEntry]:
+        # Объект с одной страницей вложенного списка, например жанр со страницей filmworks
+        return await self._get_entry(self.page_key(instance_id, page_number, page_size), self._parse_instance, refresh)
+
+    async def set_by_page(self, instance_id: str, page_number: int, page_size: int, value: BaseModel,
+                          ref_ids: Sequence[str] = ()) -> CacheEntry:
+        # ref_ids - документы страницы, кроме самого объекта
+        return await self._set_entry(self.page_key(instance_id, page_number, page_size), value, value.dict(),
+                                     [instance_id, *ref_ids])
+
+    async def set_not_found_by_page(self, instance_id: str, page_number: int, page_size: int) -> CacheEntry:
+        return await self._set_not_found(self.page_key(instance_id, page_number, page_size), [instance_id])
+
+    async def get_many_entries_by_ids(self, instance_ids: List[str],
+                                      refresh: Optional[Callable[[str], Awaitable[Any]]] = None
+                                      ) -> Dict[str, CacheEntry]:
+        # L1, затем один MGET на все промахи. Устаревшие записи отдаются и обновляются в фоне по одной
+        found = {}
+        missing_keys = {}
+        for instance_id in instance_ids:
+            key = self.id_key(instance_id)
+            entry = self.local.get(key)
+            if entry is not None:
+                self._count_hit(entry)
+                found[instance_id] = entry
+            else:
+                missing_keys[key] = instance_id
+        keys = list(missing_keys)
+        try:
+            values = await self.storage.get_many(keys)
+        except Exception:
+            self._requests['error'].inc(len(keys))
+            raise
+        for key, data in zip(keys, values):
+            if not data:
+                self._requests['miss'].inc()
+                continue
+            entry = self._decode(data, self._parse_instance)
+            if entry is None:
+                self._requests['error'].inc()
+                continue
+            self.local.set(key, entry)
+            self._count_hit(entry)
+            found[missing_keys[key]] = entry
+        if refresh is not None:
+            for instance_id, entry in found.items():
+                if entry.is_stale:
+                    self._refresh_in_background(self.id_key(instance_id), functools.partial(refresh, instance_id))
+        return found
+
+    async def get_many_by_ids(self, instance_ids: List[str]) -> Dict[str, BaseModel]:
+        entries = await self.get_many_entries_by_ids(instance_ids)
+        return {instance_id: entry.value for instance_id, entry in entries.items()}
+
+    async def set_many_by_ids(self, values: List[BaseModel]) -> Dict[str, CacheEntry]:
+        entries = {}
+        items = {}
+        for value in values:
+            key = self.id_key(value.id)
+            payload = value.dict()
+            entry = entries[value.id] = self._new_entry(value, payload)
+            self.local.set(key, entry)
+            items[key] = self._encode(entry, payload)
+        await self.storage.set_many(items, ttl=self.ttl + self.stale_ttl)
+        return entries
+
+    async def set_many_not_found_by_ids(self, instance_ids: List[str]) -> Dict[str, CacheEntry]:
+        entries = {}
+        items = {}
+        for instance_id in instance_ids:
+            key = self.id_key(instance_id)
+            entry = entries[instance_id] = self._new_not_found_entry()
+            self.local.set(key, entry)
+            items[key] = self._encode_not_found(entry)
+        await self.storage.set_many(items, ttl=self.negative_ttl)
+        return entries
+
+    async def get_by_elastic_query(self, query_elastic: dict,
+                                   refresh: Optional[Callable[[], Awaitable[Any]]] = None
+                                   ) -> Optional[List[BaseModel]]:
+        entry = await self._get_entry(self.query_key(query_elastic), self._parse_list, refresh)
+        return entry.value if entry else None
+
+    async def set_by_elastic_query(self, query_elastic: dict, values: List[BaseModel]) -> None:
+        # Пустой результат ни на что не ссылается и живёт только NEGATIVE_CACHE_TTL
+        if not values:
+            await self._set_not_found(self.query_key(query_elastic), [])
+            return
+        await self._set_entry(self.query_key(query_elastic), values, [value.dict() for value in values],
+                              [value.id for value in values])
+
+    def relation_key(self, relation: str, owner_id: str) -> str:
+        return f'{self.model_class.__name__}:{relation}:{owner_id}'
+
+    async def get_by_relation(self, relation: str, owner_id: str,
+                              refresh: Optional[Callable[[], Awaitable[Any]]] = None) -> Optional[List[BaseModel]]:
+        # Список связанных объектов владельца, например фильмы персоны
+        entry = await self._get_entry(self.relation_key(relation, owner_id), self._parse_list, refresh)
+        return entry.value if entry else None
+
+    async def set_by_relation(self, relation: str, owner_id: str, values: List[BaseModel]) -> None:
+        key = self.relation_key(relation, owner_id)
+        if not values:
+            await self._set_not_found(key, [owner_id])
+            return
+        await self._set_entry(key, values, [value.dict() for value in values],
+                              [owner_id] + [value.id for value in values])
+
+
+class ResponseCache:
+    # Готовые байты ответа по пути и нормализованным query-параметрам: попадание отдаётся без pydantic
+    # и без обращения к сервисам. Хранится как JSON с моментом записи и заголовками, перевод строки и тело.
+    def __init__(self, storage: AbstractCacheStorage, ttl: int = config.RESPONSE_CACHE_TTL,
+                 track_refs: bool = config.CACHE_INVALIDATION_ENABLED):
+        self.storage = storage
+        self.ttl = ttl
+        self.track_refs = track_refs
+
+    @staticmethod
+    def key(path: str, query_string: bytes) -> str:
+        params = sorted(urllib.parse.parse_qsl(query_string.decode('latin-1'), keep_blank_values=True))
+        fingerprint = hashlib.blake2b(urllib.parse.urlencode(params).encode(), digest_size=16).hexdigest()
+        return f'response:{path}:{fingerprint}'
+
+    @staticmethod
+    def ref_ids(body: bytes) -> List[str]:
+        # id всех документов в ответе: uuid самих объектов и вложенных жанров, персон и фильмов
+        ids: Dict[str, None] = {}
+        try:
+            stack = [orjson.loads(body)]
+        except orjson.JSONDecodeError:
+            return []
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                if isinstance(item.get('uuid'), str):
+                    ids[item['uuid']] = None
+                stack.extend(item.values())
+            elif isinstance(item, list):
+                stack.extend(item)
+        return list(ids)
+
+    @staticmethod
+    def _age_headers(headers: List[Tuple[bytes, bytes]], age: int) -> List[Tuple[bytes, bytes]]:
+        # max-age считается от момента записи ответа в кэш, а не от момента выдачи
+        def max_age(match: 're.Match') -> bytes:
+            return b'max-age=%d' % max(0, int(match.group(1)) - age)
+
+        return [(name, MAX_AGE_RE.sub(max_age, value) if name == b'cache-control' else value)
+                for name, value in headers]
+
+    async def get(self, key: str) -> Optional[Tuple[List[Tuple[bytes, bytes]], bytes]]:
         data = await self.storage.get(key)
         if not data:
             return None
-        return parse_raw_as(List[self.model_class], data)
+        raw_meta, _, body = data.partition(b'\n')
+        try:
+            meta = orjson.loads(raw_meta)
+            headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in meta['h']]
+            age = int(time.time() - meta['t'])
+        except (orjson.JSONDecodeError, TypeError, KeyError, ValueError):
+            # Запись в старом формате (без момента записи) или повреждённая: промах, ответ перезапишется
+            logger.warning(f'Unable to decode cached response {key=}')
+            await self.storage.delete(key)
+            return None
+        return self._age_headers(headers, age), body
 
-    async def set_by_elastic_query(self, query_elastic: dict, values: List[BaseModel]) -> None:
-        key = f'{self.model_class.__name__}:query:{str(query_elastic)}'
-        await self.storage.set(key=key, value=json.dumps([value.dict() for value in values]))
+    async def set(self, key: str, headers: List[Tuple[bytes, bytes]], body: bytes) -> None:
+        stored_at = time.time()
+        raw_meta = orjson.dumps({'t': stored_at,
+                                 'h': [(name.decode('latin-1'), value.decode('latin-1')) for name, value in headers]})
+        writes = [self.storage.set(key=key, value=raw_meta + b'\n' + body, ttl=self.ttl)]
+        if self.track_refs:
+            # Ответ вычищается при инвалидации любого документа из него, как и записи ModelCache
+            # Те же множества хранят ссылки записей ModelCache, их срок не укорачиваем
+            writes.append(self.storage.add_refs({ref_key(ref_id): {key: stored_at + self.ttl}
+                                                 for ref_id in self.ref_ids(body)},
+                                                ttl=max(self.ttl, config.CACHE_TTL + config.CACHE_STALE_TTL)))
+        await asyncio.gather(*writes)
 
 
 cache: Optional[AbstractCacheStorage] = None
 
 
+async def create_redis_connections() -> List[Redis]:
+    if config.REDIS_SENTINELS:
+        # Адрес мастера берётся у Sentinel и обновляется при failover
+        sentinel = await aioredis.create_sentinel(config.REDIS_SENTINELS, minsize=config.REDIS_POOL_MINSIZE,
+                                                  maxsize=config.REDIS_POOL_MAXSIZE)
+        return [sentinel.master_for(config.REDIS_SENTINEL_MASTER)]
+    return [await aioredis.create_redis_pool(address, minsize=config.REDIS_POOL_MINSIZE,
+                                             maxsize=config.REDIS_POOL_MAXSIZE)
+            for address in config.REDIS_NODES]
+
+
 async def get_cache_storage() -> AbstractCacheStorage:
     global cache
     if not cache:
-        redis = await aioredis.create_redis_pool((config.REDIS_HOST, config.REDIS_PORT), minsize=10, maxsize=20)
-        cache = RedisCacheStorage(redis=redis, ttl=config.CACHE_TTL)
+        nodes = [RedisCacheStorage(redis=redis, ttl=config.CACHE_TTL, auto_pipeline=config.REDIS_AUTO_PIPELINE)
+                 for redis in await create_redis_connections()]
+        cache = nodes[0] if len(nodes) == 1 else ShardedCacheStorage(nodes)
     return cache
@@ -0,0 +1,102 @@
+import logging
+import zlib
+from typing import Any, Callable, Dict, Tuple
+
+import orjson
+
+import config
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+logger = logging.getLogger(__name__)
+
+# Первый байт значения - версия формата: младшие 4 бита - сериализатор, старшие - сжатие.
+# Декодер смотрит только на этот байт, поэтому кодек можно поменять без сброса кэша.
+# Записи без заголовка (до появления кодеков) начинаются с '{' и читаются как orjson.
+LEGACY_JSON_PREFIX = b'{'
+
+Serializer = Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]
+Compressor = Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]
+
+SERIALIZERS: Dict[int, Serializer] = {
+    1: (orjson.dumps, orjson.loads),
+}
+SERIALIZER_IDS = {'json': 1}
+if msgpack is not None:
+    SERIALIZERS[2] = (msgpack.packb, msgpack.unpackb)
+    SERIALIZER_IDS['msgpack'] = 2
+
+COMPRESSORS: Dict[int, Compressor] = {
+    1: (zlib.compress, zlib.decompress),
+}
+COMPRESSOR_IDS = {'none': 0, 'zlib': 1}
+if zstandard is not None:
+    COMPRESSORS[2] = (zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress)
+    COMPRESSOR_IDS['zstd'] = 2
+if lz4 is not None:
+    COMPRESSORS[3] = (lz4.frame.compress, lz4.frame.decompress)
+    COMPRESSOR_IDS['lz4'] = 3
+
+
+class CodecError(ValueError):
+    pass
+
+
+class CacheCodec:
+    # Сжимается только значение длиннее threshold байт: на коротких сжатие не окупается
+    def __init__(self, serializer: str = 'json', compression: str = 'none', threshold: int = 1024) -> None:
+        if serializer not in SERIALIZER_IDS:
+            logger.warning(f'Cache serializer {serializer!r} is not available, using json')
+            serializer = 'json'
+        if compression not in COMPRESSOR_IDS:
+            logger.warning(f'Cache compression {compression!r} is not available, using zlib')
+            compression = 'zlib'
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self._serializer_id = SERIALIZER_IDS[serializer]
+        self._compressor_id = COMPRESSOR_IDS[compression]
+
+    def encode(self, value: Any) -> bytes:
+        dumps, _ = SERIALIZERS[self._serializer_id]
+        data = dumps(value)
+        compressor_id = 0
+        if self._compressor_id and len(data) > self.threshold:
+            compress, _ = COMPRESSORS[self._compressor_id]
+            data = compress(data)
+            compressor_id = self._compressor_id
+        return bytes([self._serializer_id | compressor_id << 4]) + data
+
+    @staticmethod
+    def decode(data: bytes) -> Any:
+        if data[:1] == LEGACY_JSON_PREFIX:
+            return orjson.loads(data)
+        if not data:
+            raise CodecError('Empty cache value')
+        version, data = data[0], data[1:]
+        serializer = SERIALIZERS.get(version & 0x0f)
+        compressor = COMPRESSORS.get(version >> 4) if version >> 4 else None
+        if serializer is None or (version >> 4 and compressor is None):
+            raise CodecError(f'Unsupported cache value version {version}')
+        try:
+            if compressor is not None:
+                data = compressor[1](data)
+            return serializer[1](data)
+        except Exception as e:
+            raise CodecError(f'Unable to decode cache value: {e}') from e
+
+
+default_codec = CacheCodec(config.CACHE_SERIALIZER, config.CACHE_COMPRESSION, config.CACHE_COMPRESS_THRESHOLD)
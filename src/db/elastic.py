@@ -1,9 +1,76 @@
-from typing import Optional
+import asyncio
+import weakref
+from typing import List, Optional
 
+import aiohttp
 from elasticsearch import AsyncElasticsearch
+from elasticsearch._async.http_aiohttp import AIOHttpConnection, ESClientResponse
+
+import config
 
 es: Optional[AsyncElasticsearch] = None
 
+# Все открытые соединения процесса, по ним считается заполненность пулов
+_connections: 'weakref.WeakSet[PooledConnection]' = weakref.WeakSet()
+
+
+class PooledConnection(AIOHttpConnection):
+    # AIOHttpConnection с настраиваемым keepalive и счётчиком запросов в работе
+    def __init__(self, *args, keepalive_timeout: float = config.ES_KEEPALIVE, **kwargs) -> None:
+        super(PooledConnection, self).__init__(*args, **kwargs)
+        self._keepalive_timeout = keepalive_timeout
+        self.in_flight = 0
+        _connections.add(self)
+
+    @property
+    def pool_size(self) -> int:
+        return self._limit
+
+    async def perform_request(self, *args, **kwargs):
+        self.in_flight += 1
+        try:
+            return await super(PooledConnection, self).perform_request(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    async def _create_aiohttp_session(self) -> None:
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            auto_decompress=True,
+            loop=self.loop,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            response_class=ESClientResponse,
+            connector=aiohttp.TCPConnector(
+                limit=self._limit, use_dns_cache=True, ssl=self._ssl_context,
+                keepalive_timeout=self._keepalive_timeout,
+            ),
+        )
+
+
+def pool_saturation() -> float:
+    # Доля занятых соединений по всем узлам: 1.0 - новые запросы ждут свободного соединения
+    connections = list(_connections)
+    capacity = sum(connection.pool_size for connection in connections)
+    if not capacity:
+        return 0.0
+    return min(1.0, sum(connection.in_flight for connection in connections) / capacity)
+
+
+def create_elastic(hosts: List[str] = config.ES_HOSTS) -> AsyncElasticsearch:
+    return AsyncElasticsearch(
+        hosts,
+        connection_class=PooledConnection,
+        maxsize=config.ES_POOL_SIZE,
+        keepalive_timeout=config.ES_KEEPALIVE,
+        timeout=config.ES_TIMEOUT,
+        max_retries=config.ES_MAX_RETRIES,
+        retry_on_timeout=config.ES_RETRY_ON_TIMEOUT,
+        sniff_on_start=config.ES_SNIFF_ON_START,
+        sniffer_timeout=config.ES_SNIFFER_TIMEOUT,
+    )
+
 
 async def get_elastic() -> AsyncElasticsearch:
     return es
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+import orjson
+
+import config
+from db.cache import AbstractCacheStorage, id_key, invalidate_local, ref_key
+from db.models import Film, Genre, Person
+
+logger = logging.getLogger(__name__)
+
+# Модель, под которой документ индекса кэшируется по id
+INDEX_MODELS = {'movies': Film, 'persons': Person, 'genres': Genre}
+
+_listener: Optional[asyncio.Future] = None
+
+
+async def invalidate(storage: AbstractCacheStorage, index: str, ids: List[str], publish: bool = True) -> List[str]:
+    # Удаляет из Redis все записи, где встречаются документы ids (сами документы, поиски, фильмографии,
+    # страницы жанров), и рассылает удалённые ключи остальным процессам для очистки L1
+    members = await storage.pop_refs([ref_key(instance_id) for instance_id in ids])
+    model = INDEX_MODELS.get(index)
+    id_keys = [id_key(model.__name__, instance_id) for instance_id in ids] if model else []
+    keys = list(dict.fromkeys(id_keys + [key for ref_keys in members for key in ref_keys]))
+    if keys:
+        await storage.delete(*keys)
+        invalidate_local(keys)
+        logger.debug(f'Invalidated {len(keys)} cache keys for {len(ids)} {index} documents')
+        if publish:
+            await storage.publish(config.CACHE_INVALIDATION_CHANNEL,
+                                  orjson.dumps({'index': index, 'ids': ids, 'keys': keys}))
+    return keys
+
+
+async def handle_message(storage: AbstractCacheStorage, message: bytes) -> None:
+    try:
+        data = orjson.loads(message)
+        index, ids = data['index'], data['ids']
+    except (orjson.JSONDecodeError, TypeError, KeyError):
+        logger.warning(f'Malformed cache invalidation message {message!r}')
+        return
+    if 'keys' in data:
+        # Redis уже очищен тем, кто опубликовал сообщение, осталась локальная копия
+        invalidate_local(data['keys'])
+        return
+    # Сообщение от индексатора: только id. Множества ссылок забирает первый процесс,
+    # он же рассылает список ключей, у остальных pop вернёт пустой результат
+    await invalidate(storage, index, ids)
+
+
+async def listen(storage: AbstractCacheStorage) -> None:
+    while True:
+        try:
+            async for message in storage.subscribe(config.CACHE_INVALIDATION_CHANNEL):
+                await handle_message(storage, message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Cache invalidation listener failed, resubscribing')
+            await asyncio.sleep(1)
+
+
+def start_listener(storage: AbstractCacheStorage) -> None:
+    global _listener
+    _listener = asyncio.ensure_future(listen(storage))
+
+
+async def stop_listener() -> None:
+    if _listener is None:
+        return
+    _listener.cancel()
+    try:
+        await _listener
+    except asyncio.CancelledError:
+        pass
@@ -35,9 +35,18 @@ class FilmShort(BaseESModel):
     imdb_rating: Optional[float]
 
 
-class Genre(BaseESModel):
+class GenreShort(BaseESModel):
     name: str
+
+
+class Genre(GenreShort):
+    filmworks: List[FilmShort]
+
+
+class GenrePage(GenreShort):
+    # Жанр с одной страницей фильмов и их общим числом
     filmworks: List[FilmShort]
+    filmworks_total: int
 
 
 class Person(BaseESModel):
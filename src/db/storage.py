@@ -1,33 +1,69 @@
+import base64
+import binascii
 import logging
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
 import elasticsearch
+import orjson
 from elasticsearch import AsyncElasticsearch
 from elasticsearch_dsl import Search
 from fastapi import HTTPException
 from starlette import status
 
+from metrics import ES_DURATION
+from timing import phase
+
 logger = logging.getLogger(__name__)
 
 
+def encode_cursor(sort_values: list) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(sort_values)).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        sort_values = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Malformed cursor')
+    if not isinstance(sort_values, list):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Malformed cursor')
+    return sort_values
+
+
 class AbstractStorage(ABC):
     @abstractmethod
     async def get_by_id(self, instance_id: str):
         pass
 
     @abstractmethod
-    async def bulk_get_by_ids(self, ids: List[str]):
+    async def bulk_get_by_ids(self, ids: List[str], source: Optional[List[str]] = None):
         pass
 
     @abstractmethod
     async def search(self, query: Search):
         pass
 
+    @abstractmethod
+    async def search_with_total(self, query: dict):
+        pass
+
+    @abstractmethod
+    async def search_with_cursor(self, query: dict):
+        pass
+
+    @abstractmethod
+    def export(self, batch_size: int, keep_alive: str) -> AsyncIterator[List[dict]]:
+        pass
+
     @abstractmethod
     async def build_search_query(self, *args, **kwargs):
         pass
 
+    @abstractmethod
+    async def build_cursor_query(self, *args, **kwargs):
+        pass
+
     @staticmethod
     @abstractmethod
     def prepare_query(s: Search, search_query, sort):
@@ -47,15 +83,20 @@ class ElasticSearchStorage(AbstractStorage):
 
     async def get_by_id(self, instance_id: str) -> Optional[dict]:
         try:
-            doc = await self.elastic.get(self.index, instance_id)
+            with ES_DURATION.labels('get', self.index).time(), phase('es'):
+                doc = await self.elastic.get(self.index, instance_id)
             return doc['_source']
         except elasticsearch.exceptions.NotFoundError:
             return None
 
-    async def bulk_get_by_ids(self, ids: List[str]) -> List[dict]:
+    async def bulk_get_by_ids(self, ids: List[str], source: Optional[List[str]] = None) -> List[dict]:
+        if not ids:
+            return []
         try:
-            res = await self.elastic.mget(body={'ids': ids}, index=self.index)
-            return [doc['_source'] for doc in res['docs']]
+            # Порядок документов в ответе mget совпадает с порядком ids
+            with ES_DURATION.labels('mget', self.index).time(), phase('es'):
+                res = await self.elastic.mget(body={'ids': ids}, index=self.index, _source_includes=source)
+            return [doc['_source'] for doc in res['docs'] if doc.get('found')]
         except elasticsearch.exceptions.NotFoundError:
             return []
 
@@ -67,30 +108,102 @@ class ElasticSearchStorage(AbstractStorage):
             s = s.sort(sort)
         return s
 
-    async def build_search_query(self, search_query: str = "",
-                                 search_filter: Optional[str] = None,
-                                 sort: Optional[str] = None,
-                                 page_number: int = 1, page_size: int = 50):
+    def _prepare_search(self, search_query: str, search_filter: Optional[str], sort: Optional[str],
+                        source: Optional[List[str]]) -> Search:
         s = Search(using=self.elastic, index=self.index)
         if not self._query_builder:
             s = self.prepare_query(s, search_query, sort)
         else:
             s = self._query_builder.prepare_query(s, search_query, search_filter, sort)
-        s = self.get_paginated_query(s, page_number, page_size)
+        if source:
+            s = s.source(source)
         return s
 
-    async def search(self, query: Search) -> List[dict]:
+    async def build_search_query(self, search_query: str = "",
+                                 search_filter: Optional[str] = None,
+                                 sort: Optional[str] = None,
+                                 page_number: int = 1, page_size: int = 50,
+                                 source: Optional[List[str]] = None):
+        with phase('query'):
+            s = self._prepare_search(search_query, search_filter, sort, source)
+            return self.get_paginated_query(s, page_number, page_size)
+
+    async def build_cursor_query(self, search_query: str = "",
+                                 search_filter: Optional[str] = None,
+                                 sort: Optional[str] = None,
+                                 cursor: str = '', page_size: int = 50,
+                                 source: Optional[List[str]] = None) -> dict:
+        with phase('query'):
+            s = self._prepare_search(search_query, search_filter, sort, source)
+            return self.get_cursor_query(s, cursor, page_size)
+
+    async def _search(self, query: dict) -> dict:
         try:
-            search_result = await self.elastic.search(index=self.index, body=query)
+            with ES_DURATION.labels('search', self.index).time(), phase('es'):
+                search_result = await self.elastic.search(index=self.index, body=query)
         except elasticsearch.exceptions.RequestError as re:
             if re.error == 'search_phase_execution_exception':
                 # Если используется sort которого нет в elastic
                 raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Malformed request')
             raise
-        items = [hit['_source'] for hit in search_result['hits']['hits']]
+        return search_result
+
+    async def _search_hits(self, query: dict) -> List[dict]:
+        return (await self._search(query))['hits']['hits']
+
+    async def search(self, query: Search) -> List[dict]:
+        items = [hit['_source'] for hit in await self._search_hits(query)]
         return items
 
+    async def search_with_total(self, query: dict) -> Tuple[List[dict], int]:
+        # Страница документов и общее число найденных (точное при track_total_hits)
+        search_result = await self._search(query)
+        return [hit['_source'] for hit in search_result['hits']['hits']], search_result['hits']['total']['value']
+
+    async def search_with_cursor(self, query: dict) -> Tuple[List[dict], Optional[str]]:
+        hits = await self._search_hits(query)
+        items = [hit['_source'] for hit in hits]
+        # Неполная страница - последняя, курсор дальше не нужен
+        next_cursor = encode_cursor(hits[-1]['sort']) if hits and len(hits) == query['size'] else None
+        return items, next_cursor
+
+    async def export(self, batch_size: int = 1000, keep_alive: str = '1m') -> AsyncIterator[List[dict]]:
+        # Обход всего индекса по point-in-time снимку: параллельная индексация не влияет на выгрузку
+        pit = await self.elastic.open_point_in_time(index=self.index, keep_alive=keep_alive)
+        pit_id = pit['id']
+        search_after = None
+        try:
+            while True:
+                body = {
+                    'size': batch_size,
+                    'sort': [{'id': 'asc'}],
+                    'track_total_hits': False,
+                    'pit': {'id': pit_id, 'keep_alive': keep_alive},
+                }
+                if search_after:
+                    body['search_after'] = search_after
+                search_result = await self.elastic.search(body=body)
+                pit_id = search_result.get('pit_id', pit_id)
+                hits = search_result['hits']['hits']
+                if not hits:
+                    break
+                yield [hit['_source'] for hit in hits]
+                if len(hits) < batch_size:
+                    break
+                search_after = hits[-1]['sort']
+        finally:
+            await self.elastic.close_point_in_time(body={'id': pit_id})
+
     @staticmethod
     def get_paginated_query(search: Search, page_number: int, page_size: int) -> dict:
         start = (page_number - 1) * page_size
         return search[start: start + page_size].to_dict()
+
+    @staticmethod
+    def get_cursor_query(search: Search, cursor: str, page_size: int) -> dict:
+        query = search[:page_size].to_dict()
+        # id как tiebreaker: search_after требует однозначного порядка документов
+        query['sort'] = query.get('sort', ['_score']) + [{'id': 'asc'}]
+        if cursor:
+            query['search_after'] = decode_cursor(cursor)
+        return query
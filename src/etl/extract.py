@@ -0,0 +1,90 @@
+import asyncio
+import itertools
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, List
+
+import config
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+Row = tuple
+
+# Все запросы отсортированы по id родительской записи: документы собираются слиянием отсортированных потоков,
+# поэтому в памяти нет ничего, кроме текущих пачек. uuid в Postgres сортируется так же, как его строка в Python
+FILMS = 'SELECT id, title, description, rating FROM film_work ORDER BY id'
+FILM_PERSONS = ('SELECT pfw.film_work_id, pfw.role, p.id, p.full_name FROM person_film_work pfw '
+                'JOIN person p ON p.id = pfw.person_id ORDER BY pfw.film_work_id, p.full_name')
+FILM_GENRES = ('SELECT gfw.film_work_id, g.id, g.name FROM genre_film_work gfw '
+               'JOIN genre g ON g.id = gfw.genre_id ORDER BY gfw.film_work_id, g.name')
+PERSONS = 'SELECT id, full_name FROM person ORDER BY id'
+PERSON_FILMS = 'SELECT person_id, role, film_work_id FROM person_film_work ORDER BY person_id, film_work_id'
+GENRES = 'SELECT id, name FROM genre ORDER BY id'
+GENRE_FILMS = ('SELECT gfw.genre_id, fw.id, fw.title, fw.rating FROM genre_film_work gfw '
+               'JOIN film_work fw ON fw.id = gfw.film_work_id ORDER BY gfw.genre_id, fw.title')
+
+
+class Source:
+    # Чтение из DB-API соединения пачками по fetch_size. Соединения sqlite3 и psycopg2 нельзя делить
+    # между потоками, поэтому все вызовы идут через один поток, а event loop в это время не блокируется
+    def __init__(self, connect: Callable[[], Any], fetch_size: int = config.ETL_FETCH_SIZE,
+                 server_side: bool = False) -> None:
+        self.fetch_size = fetch_size
+        self.server_side = server_side
+        self._connect = connect
+        self._connection = None
+        self._cursor_names = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, fn: Callable, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _execute(self, query: str):
+        if self._connection is None:
+            self._connection = self._connect()
+        if self.server_side:
+            # Именованный курсор psycopg2 - серверный: строки приходят с сервера по fetchmany, а не все сразу
+            cursor = self._connection.cursor(f'etl_{next(self._cursor_names)}')
+        else:
+            cursor = self._connection.cursor()
+        cursor.execute(query)
+        return cursor
+
+    async def rows(self, query: str) -> AsyncIterator[List[Row]]:
+        cursor = await self._run(self._execute, query)
+        try:
+            # Следующая пачка читается, пока обрабатывается текущая
+            pending = self._run(cursor.fetchmany, self.fetch_size)
+            while True:
+                batch = await pending
+                if not batch:
+                    return
+                pending = self._run(cursor.fetchmany, self.fetch_size)
+                yield batch
+        finally:
+            await self._run(cursor.close)
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._run(self._connection.close)
+        self._executor.shutdown()
+
+
+def sqlite_source(path: str, fetch_size: int = config.ETL_FETCH_SIZE) -> Source:
+    return Source(lambda: sqlite3.connect(path), fetch_size=fetch_size)
+
+
+def postgres_source(dsn: str = config.POSTGRES_DSN, fetch_size: int = config.ETL_FETCH_SIZE) -> Source:
+    if psycopg2 is None:
+        raise RuntimeError('psycopg2 is required to read from Postgres')
+
+    def connect():
+        connection = psycopg2.connect(dsn)
+        # Все курсоры одной загрузки видят один снимок базы
+        connection.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        return connection
+
+    return Source(connect, fetch_size=fetch_size, server_side=True)
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_streaming_bulk
+
+import config
+
+logger = logging.getLogger(__name__)
+
+OnLoaded = Callable[[List[str]], Awaitable]
+
+
+@dataclass
+class LoadStats:
+    index: str
+    loaded: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+@asynccontextmanager
+async def bulk_indexing(es: AsyncElasticsearch, index: str) -> AsyncIterator[None]:
+    # На время полной загрузки индекс не обновляется для поиска, в конце - один refresh
+    settings = await es.indices.get_settings(index=index, name='index.refresh_interval')
+    refresh_interval = settings.get(index, {}).get('settings', {}).get('index', {}).get('refresh_interval')
+    await es.indices.put_settings(index=index, body={'index': {'refresh_interval': '-1'}})
+    try:
+        yield
+    finally:
+        # None возвращает значение по умолчанию
+        await es.indices.put_settings(index=index, body={'index': {'refresh_interval': refresh_interval}})
+        await es.indices.refresh(index=index)
+
+
+async def load_index(es: AsyncElasticsearch, index: str, documents: AsyncIterator[dict],
+                     chunk_size: int = config.ETL_CHUNK_SIZE, concurrency: int = config.ETL_CONCURRENCY,
+                     queue_size: int = config.ETL_QUEUE_SIZE, on_loaded: Optional[OnLoaded] = None) -> LoadStats:
+    # Документы идут через ограниченную очередь к concurrency потокам _bulk: если elastic не успевает,
+    # очередь заполняется и чтение из базы ждёт. Ответ 429 от elastic повторяется с нарастающей паузой
+    stats = LoadStats(index)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    started = time.monotonic()
+
+    async def produce() -> None:
+        async for document in documents:
+            await queue.put(document)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def actions() -> AsyncIterator[dict]:
+        while True:
+            document = await queue.get()
+            if document is None:
+                return
+            yield {'_index': index, '_id': document['id'], '_source': document}
+
+    async def consume() -> None:
+        loaded_ids: List[str] = []
+        async for ok, item in async_streaming_bulk(es, actions(), chunk_size=chunk_size, max_retries=3,
+                                                   raise_on_error=False, raise_on_exception=False):
+            result = item['index']
+            if not ok:
+                stats.failed += 1
+                logger.error(f'Failed to index {index}/{result.get("_id")}: {result.get("error")}')
+                continue
+            stats.loaded += 1
+            if on_loaded is not None:
+                loaded_ids.append(result['_id'])
+                if len(loaded_ids) >= chunk_size:
+                    await on_loaded(loaded_ids)
+                    loaded_ids = []
+        if on_loaded is not None and loaded_ids:
+            await on_loaded(loaded_ids)
+
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(consume()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    stats.seconds = time.monotonic() - started
+    logger.info(f'Loaded {stats.loaded} {index} documents in {stats.seconds:.1f}s, {stats.failed} failed')
+    return stats
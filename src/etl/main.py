@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import logging
+from functools import partial
+from typing import List, Optional
+
+from elasticsearch import AsyncElasticsearch
+
+import config
+from db import cache, elastic, invalidation
+from db.cache import AbstractCacheStorage
+from etl.extract import Source, postgres_source, sqlite_source
+from etl.load import LoadStats, bulk_indexing, load_index
+from etl.transform import TRANSFORMS
+
+logger = logging.getLogger(__name__)
+
+INDICES = list(TRANSFORMS)
+
+
+async def run(source: Source, es: AsyncElasticsearch, indices: List[str] = INDICES,
+              chunk_size: int = config.ETL_CHUNK_SIZE, concurrency: int = config.ETL_CONCURRENCY,
+              queue_size: int = config.ETL_QUEUE_SIZE,
+              storage: Optional[AbstractCacheStorage] = None) -> List[LoadStats]:
+    # Полная перезагрузка индексов по очереди; со storage загруженные документы удаляются из кэша
+    results = []
+    for index in indices:
+        on_loaded = partial(invalidation.invalidate, storage, index) if storage is not None else None
+        async with bulk_indexing(es, index):
+            results.append(await load_index(es, index, TRANSFORMS[index](source), chunk_size=chunk_size,
+                                            concurrency=concurrency, queue_size=queue_size, on_loaded=on_loaded))
+    return results
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Полная загрузка индексов elastic из Postgres или SQLite')
+    source_group = parser.add_mutually_exclusive_group()
+    source_group.add_argument('--postgres', default=config.POSTGRES_DSN, help='DSN базы Postgres')
+    source_group.add_argument('--sqlite', help='путь к базе SQLite с той же схемой')
+    parser.add_argument('--indices', nargs='+', choices=INDICES, default=INDICES)
+    parser.add_argument('--fetch-size', type=int, default=config.ETL_FETCH_SIZE)
+    parser.add_argument('--chunk-size', type=int, default=config.ETL_CHUNK_SIZE)
+    parser.add_argument('--concurrency', type=int, default=config.ETL_CONCURRENCY)
+    parser.add_argument('--queue-size', type=int, default=config.ETL_QUEUE_SIZE)
+    parser.add_argument('--invalidate', action='store_true', help='удалить загруженные документы из кэша Redis')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        source = sqlite_source(args.sqlite, fetch_size=args.fetch_size)
+    else:
+        source = postgres_source(args.postgres, fetch_size=args.fetch_size)
+    es = elastic.create_elastic()
+    storage = await cache.get_cache_storage() if args.invalidate else None
+    try:
+        await run(source, es, indices=args.indices, chunk_size=args.chunk_size, concurrency=args.concurrency,
+                  queue_size=args.queue_size, storage=storage)
+    finally:
+        await source.close()
+        await es.close()
+        if storage is not None:
+            await storage.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
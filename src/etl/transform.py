@@ -0,0 +1,106 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from etl import extract
+from etl.extract import Row, Source
+
+# Роль в person_film_work и поле фильма со списком участников в этой роли
+ROLE_FIELDS = {'actor': 'actors', 'writer': 'writers', 'director': 'directors'}
+
+Group = Tuple[str, List[Row]]
+
+
+async def iter_groups(batches: AsyncIterator[List[Row]]) -> AsyncIterator[Group]:
+    # Подряд идущие строки с одинаковым первым столбцом (id родителя)
+    key, rows = None, []
+    async for batch in batches:
+        for row in batch:
+            if row[0] != key:
+                if rows:
+                    yield key, rows
+                key, rows = row[0], []
+            rows.append(row)
+    if rows:
+        yield key, rows
+
+
+class Children:
+    # Дочерние строки, отсортированные по id родителя; take вызывается с возрастающими id
+    def __init__(self, batches: AsyncIterator[List[Row]]) -> None:
+        self._batches = batches
+        self._groups = iter_groups(batches)
+        self._current: Optional[Group] = None
+        self._done = False
+
+    async def take(self, parent_id: str) -> List[Row]:
+        while not self._done:
+            if self._current is None:
+                try:
+                    self._current = await self._groups.__anext__()
+                except StopAsyncIteration:
+                    self._done = True
+                    break
+            key, rows = self._current
+            if key > parent_id:
+                break
+            # Строки без родителя (key < parent_id) пропускаются
+            self._current = None
+            if key == parent_id:
+                return rows
+        return []
+
+    async def close(self) -> None:
+        # Закрывает курсор, если родительский поток закончился раньше дочернего
+        await self._groups.aclose()
+        await self._batches.aclose()
+
+
+async def films(source: Source) -> AsyncIterator[dict]:
+    persons = Children(source.rows(extract.FILM_PERSONS))
+    genres = Children(source.rows(extract.FILM_GENRES))
+    try:
+        async for batch in source.rows(extract.FILMS):
+            for film_id, title, description, rating in batch:
+                film = {'id': film_id, 'title': title, 'description': description, 'imdb_rating': rating}
+                for field in ROLE_FIELDS.values():
+                    film[field] = []
+                for _, role, person_id, full_name in await persons.take(film_id):
+                    if role in ROLE_FIELDS:
+                        film[ROLE_FIELDS[role]].append({'id': person_id, 'name': full_name})
+                for field in ROLE_FIELDS.values():
+                    film[f'{field}_names'] = [person['name'] for person in film[field]]
+                film['genres'] = [{'id': genre_id, 'name': name} for _, genre_id, name in await genres.take(film_id)]
+                film['genres_names'] = [genre['name'] for genre in film['genres']]
+                yield film
+    finally:
+        await persons.close()
+        await genres.close()
+
+
+async def persons(source: Source) -> AsyncIterator[dict]:
+    films = Children(source.rows(extract.PERSON_FILMS))
+    try:
+        async for batch in source.rows(extract.PERSONS):
+            for person_id, full_name in batch:
+                roles: Dict[str, None] = {}
+                film_ids: Dict[str, None] = {}
+                for _, role, film_id in await films.take(person_id):
+                    roles[role] = None
+                    film_ids[film_id] = None
+                yield {'id': person_id, 'full_name': full_name, 'roles': list(roles), 'film_ids': list(film_ids)}
+    finally:
+        await films.close()
+
+
+async def genres(source: Source) -> AsyncIterator[dict]:
+    filmworks = Children(source.rows(extract.GENRE_FILMS))
+    try:
+        async for batch in source.rows(extract.GENRES):
+            for genre_id, name in batch:
+                yield {'id': genre_id, 'name': name,
+                       'filmworks': [{'id': film_id, 'title': title, 'imdb_rating': rating}
+                                     for _, film_id, title, rating in await filmworks.take(genre_id)]}
+    finally:
+        await filmworks.close()
+
+
+TRANSFORMS = {'movies': films, 'persons': persons, 'genres': genres}
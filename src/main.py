@@ -1,13 +1,16 @@
+import asyncio
 import logging
 
 import uvicorn as uvicorn
-from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, status
 from fastapi.responses import ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 import config
 from api_v1 import film, genre, person
-from db import elastic, cache
+from db import elastic, cache, invalidation
+from middleware import MetricsMiddleware, RequestLoadersMiddleware, ResponseCacheMiddleware, ServerTimingMiddleware
+import warmup
 
 app = FastAPI(
     title=config.PROJECT_NAME,
@@ -16,15 +19,44 @@ app = FastAPI(
     default_response_class=ORJSONResponse,
 )
 
+app.add_middleware(RequestLoadersMiddleware)
+
+if config.RESPONSE_CACHE_ENABLED:
+    app.add_middleware(ResponseCacheMiddleware)
+
+app.add_middleware(MetricsMiddleware)
+# Снаружи кэша ответов: иначе в кэш попал бы заголовок Server-Timing первого запроса
+app.add_middleware(ServerTimingMiddleware)
+
 
 @app.on_event('startup')
 async def startup():
-    await cache.get_cache_storage()
-    elastic.es = AsyncElasticsearch(config.ES_URL)
+    storage = await cache.get_cache_storage()
+    elastic.es = elastic.create_elastic()
+    if config.CACHE_INVALIDATION_ENABLED:
+        invalidation.start_listener(storage)
+    if config.WARMUP_ON_STARTUP:
+        asyncio.ensure_future(warmup.warm_up_in_background())
+    else:
+        warmup.ready.set()
+
+
+@app.get('/health/ready', include_in_schema=False)
+async def health_ready() -> ORJSONResponse:
+    # Готов принимать трафик только после прогрева кэша
+    if not warmup.ready.is_set():
+        return ORJSONResponse({'status': 'warming up'}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return ORJSONResponse({'status': 'ready'})
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.on_event('shutdown')
 async def shutdown():
+    await invalidation.stop_listener()
     await cache.cache.close()
     await elastic.es.close()
 
@@ -0,0 +1,48 @@
+from typing import TYPE_CHECKING, Dict, List
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+
+from db import elastic
+
+if TYPE_CHECKING:
+    from db.cache import LocalCache
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ['method', 'route', 'status'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+
+# result: hit, negative_hit, miss, error
+CACHE_REQUESTS = Counter('cache_requests_total', 'Обращения к кэшу моделей', ['model', 'result'])
+
+REDIS_DURATION = Histogram(
+    'redis_request_duration_seconds', 'Время запросов к Redis', ['operation'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1),
+)
+
+ES_DURATION = Histogram(
+    'elasticsearch_request_duration_seconds', 'Время запросов к Elasticsearch', ['operation', 'index'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+
+ES_POOL_SATURATION = Gauge('elasticsearch_pool_saturation', 'Доля занятых соединений к Elasticsearch')
+ES_POOL_SATURATION.set_function(elastic.pool_saturation)
+
+
+class LocalCacheCollector:
+    # Счётчики in-process кэша (L1) по моделям. Кэши создаются лениво, поэтому словарь читается при каждом сборе;
+    # регистрируется в db.cache, который сам импортирует этот модуль
+    def __init__(self, local_caches: Dict[str, 'LocalCache']) -> None:
+        self.local_caches = local_caches
+
+    def collect(self) -> List[Metric]:
+        hits = CounterMetricFamily('local_cache_hits', 'Попадания в in-process кэш', labels=['model'])
+        misses = CounterMetricFamily('local_cache_misses', 'Промахи in-process кэша', labels=['model'])
+        size = GaugeMetricFamily('local_cache_size', 'Записей в in-process кэше', labels=['model'])
+        for model, local_cache in self.local_caches.items():
+            stats = local_cache.stats()
+            hits.add_metric([model], stats['hits'])
+            misses.add_metric([model], stats['misses'])
+            size.add_metric([model], stats['size'])
+        return [hits, misses, size]
@@ -0,0 +1,168 @@
+import hmac
+import logging
+import time
+from typing import Any, Dict
+
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import config
+from api_v1.conditional import etag_matches
+from db import cache
+import timing
+from metrics import REQUEST_DURATION
+from services.loader import request_loaders
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTimingMiddleware:
+    # Трейлеры HTTP не поддерживаются uvicorn, поэтому отладочный JSON отдаётся обычным заголовком
+    def __init__(self, app: ASGIApp, enabled: bool = config.SERVER_TIMING_ENABLED,
+                 debug_token: str = config.SERVER_TIMING_DEBUG_TOKEN) -> None:
+        self.app = app
+        self.enabled = enabled
+        self.debug_token = debug_token
+
+    def is_debug(self, scope: Scope) -> bool:
+        token = Headers(scope=scope).get('x-debug-token')
+        return bool(self.debug_token and token and hmac.compare_digest(token, self.debug_token))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        debug = self.is_debug(scope)
+        if not (self.enabled or debug):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        token, phases = timing.start()
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                total = time.perf_counter() - started
+                headers = MutableHeaders(scope=message)
+                headers.append('Server-Timing', timing.server_timing_header(phases, total))
+                if debug:
+                    headers.append('X-Debug-Timing', orjson.dumps(timing.debug_payload(phases, total)).decode())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            timing.stop(token)
+
+
+class MetricsMiddleware:
+    # Гистограмма времени ответа по шаблону пути (/v1/film/{film_id:uuid}), а не по самому пути,
+    # иначе число рядов в Prometheus растёт с каждым id
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._route_paths: Dict[Any, str] = {}
+
+    def route_label(self, scope: Scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            # Ответ отдан до роутера (кэш ответов, 404): ищем маршрут по пути запроса
+            return self.match_route(scope)
+        if endpoint not in self._route_paths:
+            self._route_paths.update({route.endpoint: route.path for route in scope['app'].routes
+                                      if hasattr(route, 'endpoint')})
+        return self._route_paths.get(endpoint, 'unmatched')
+
+    @staticmethod
+    def match_route(scope: Scope) -> str:
+        for route in scope['app'].routes:
+            if hasattr(route, 'endpoint') and route.matches(scope)[0] == Match.FULL:
+                return route.path
+        return 'unmatched'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.labels(scope['method'], self.route_label(scope), status_code).observe(
+                time.perf_counter() - started)
+
+
+class RequestLoadersMiddleware:
+    # Свой набор BatchLoader на каждый запрос
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        token = request_loaders.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_loaders.reset(token)
+
+
+class ResponseCacheMiddleware:
+    def __init__(self, app: ASGIApp, prefix: str = config.RESPONSE_CACHE_PREFIX,
+                 ttl: int = config.RESPONSE_CACHE_TTL) -> None:
+        self.app = app
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def is_cacheable(self, scope: Scope) -> bool:
+        # Выгрузка стримится и в кэш не попадает
+        path = scope['path']
+        return (scope['type'] == 'http' and scope['method'] == 'GET'
+                and path.startswith(self.prefix) and not path.endswith('/export'))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.is_cacheable(scope):
+            await self.app(scope, receive, send)
+            return
+
+        response_cache = cache.ResponseCache(await cache.get_cache_storage(), ttl=self.ttl)
+        key = response_cache.key(scope['path'], scope['query_string'])
+        cached = await response_cache.get(key)
+        if cached:
+            headers, body = cached
+            etag = dict(headers).get(b'etag')
+            if etag and etag_matches(Headers(scope=scope).get('if-none-match'), etag.decode('latin-1')):
+                headers = [(name, value) for name, value in headers if name in (b'etag', b'cache-control')]
+                await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        start_message: Message = {}
+        chunks = []
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message
+            if message['type'] == 'http.response.start':
+                start_message = message
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+            await send(message)
+            if (message['type'] == 'http.response.body' and not message.get('more_body')
+                    and start_message.get('status') == 200):
+                await response_cache.set(key, list(start_message.get('headers', [])), b''.join(chunks))
+
+        await self.app(scope, receive, send_wrapper)
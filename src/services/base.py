@@ -1,16 +1,56 @@
 import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Type, TypeVar
 
 from pydantic import parse_obj_as
 
-from db.cache import ModelCache
+import config
+from db.cache import NOT_FOUND, CacheEntry, ModelCache
 from db.models import BaseESModel
 from db.storage import AbstractStorage
+from services.loader import get_loader
+from timing import phase
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
+
+class SingleFlight:
+    # Конкурентные вызовы с одинаковым ключом ждут один и тот же in-flight таск
+    def __init__(self) -> None:
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: отмена одного из ожидающих запросов не отменяет общий таск
+        return await asyncio.shield(task)
+
+    async def do_many(self, ids: List[str], key: Callable[[str], str],
+                      fn: Callable[[List[str]], Awaitable[Dict[str, T]]]) -> Dict[str, T]:
+        # Id, которые уже загружаются, ждут свой таск; остальные загружаются одним вызовом fn
+        new_ids = [instance_id for instance_id in ids if key(instance_id) not in self._calls]
+        if new_ids:
+            batch = asyncio.ensure_future(fn(new_ids))
+            for instance_id in new_ids:
+                task = asyncio.ensure_future(self._pick(batch, instance_id))
+                self._calls[key(instance_id)] = task
+                task.add_done_callback(lambda _, call_key=key(instance_id): self._calls.pop(call_key, None))
+        tasks = [self._calls[key(instance_id)] for instance_id in ids]
+        return dict(zip(ids, await asyncio.gather(*[asyncio.shield(task) for task in tasks])))
+
+    @staticmethod
+    async def _pick(batch: 'asyncio.Future[Dict[str, T]]', instance_id: str) -> T:
+        return (await batch)[instance_id]
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
 
 class AbstractService(ABC):
     # TODO: replace ModelCache with AbstractCache
@@ -40,50 +80,107 @@ class BaseElasticSearchService(AbstractService):
 
     def __init__(self, cache: ModelCache, storage: AbstractStorage):
         super(BaseElasticSearchService, self).__init__(cache, storage)
+        self._flights = SingleFlight()
 
     def get_model(self):
         if not self.model:
             raise Exception('Missing model')
         return self.model
 
+    async def get_entry_by_id(self, instance_id: str) -> Optional[CacheEntry]:
+        # Запись кэша вместе с хэшем содержимого (ETag) и сроком свежести.
+        # В рамках запроса id со всех вызовов за один тик загружаются одним MGET в Redis и одним mget в elastic
+        entry = await get_loader(self, self._load_entries).load(instance_id)
+        return None if entry.value is NOT_FOUND else entry
+
     async def get_by_id(self, instance_id: str):
-        instance = await self.cache.get_by_id(instance_id)
-        if not instance:
-            instance_data = await self.storage.get_by_id(instance_id)
-            if not instance_data:
-                return None
-            model = self.get_model()
-            instance = model(**instance_data)
-            logger.debug(f'got {instance.__class__.__name__} from elastic: {instance}')
-            await self.cache.set_by_id(instance_id, instance)
-        return instance
+        entry = await self.get_entry_by_id(instance_id)
+        return entry.value if entry else None
+
+    async def _load_entries(self, ids: List[str]) -> Dict[str, CacheEntry]:
+        entries = await self.cache.get_many_entries_by_ids(ids, refresh=self._refresh_entry)
+        missing_ids = [instance_id for instance_id in ids if instance_id not in entries]
+        if missing_ids:
+            entries.update(await self._flights.do_many(missing_ids, self.cache.id_key, self._fetch_entries))
+        return entries
+
+    async def _refresh_entry(self, instance_id: str) -> CacheEntry:
+        return (await self._flights.do_many([instance_id], self.cache.id_key, self._fetch_entries))[instance_id]
+
+    async def _fetch_entries(self, ids: List[str]) -> Dict[str, CacheEntry]:
+        # В кэш пишем только то, что реально пришло из elastic, остальное - как отсутствующее
+        instances_data = await self.storage.bulk_get_by_ids(ids)
+        with phase('parse'):
+            instances: List[BaseESModel] = parse_obj_as(List[self.get_model()], instances_data)
+        found = {instance.id for instance in instances}
+        entries, not_found_entries = await asyncio.gather(
+            self.cache.set_many_by_ids(instances),
+            self.cache.set_many_not_found_by_ids([instance_id for instance_id in ids if instance_id not in found]),
+        )
+        entries.update(not_found_entries)
+        return entries
 
     async def search(self, search_query: str,
                      search_filter: Optional[str] = None,
-                     sort: Optional[str] = None, page_number: Optional[int] = None, page_size: Optional[int] = None):
-        query = await self.storage.build_search_query(search_query, search_filter, sort, page_number, page_size)
-        items = await self.cache.get_by_elastic_query(query)
-        if not items:
-            items_data = await self.storage.search(query=query)
-            model = self.get_model()
+                     sort: Optional[str] = None, page_number: Optional[int] = None, page_size: Optional[int] = None,
+                     projection: Optional[Type[BaseESModel]] = None):
+        # projection - урезанная модель: из elastic запрашиваются только её поля, в кэше она лежит отдельно
+        model = projection or self.get_model()
+        cache = self.cache.for_model(model)
+        source = list(projection.__fields__) if projection else None
+        query = await self.storage.build_search_query(search_query, search_filter, sort, page_number, page_size,
+                                                      source=source)
+
+        def load():
+            return self._flights.do(cache.query_key(query), lambda: self._load_search(query, cache, model))
+
+        items = await cache.get_by_elastic_query(query, refresh=load)
+        if items is None:
+            items = await load()
+        return [] if items is NOT_FOUND else items
+
+    async def search_by_cursor(self, search_query: str,
+                               search_filter: Optional[str] = None,
+                               sort: Optional[str] = None, cursor: str = '', page_size: int = 50,
+                               projection: Optional[Type[BaseESModel]] = None) -> Tuple[List, Optional[str]]:
+        # Курсорные страницы не кэшируются: их читают краулеры, каждую по одному разу
+        model = projection or self.get_model()
+        source = list(projection.__fields__) if projection else None
+        query = await self.storage.build_cursor_query(search_query, search_filter, sort, cursor, page_size,
+                                                      source=source)
+        items_data, next_cursor = await self.storage.search_with_cursor(query)
+        with phase('parse'):
+            return parse_obj_as(List[model], items_data), next_cursor
+
+    def export(self, batch_size: int = config.EXPORT_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+        # Выгрузка идёт мимо кэша и моделей: документы отдаются как есть, пачками
+        return self.storage.export(batch_size=batch_size, keep_alive=config.EXPORT_KEEP_ALIVE)
+
+    async def preload(self, sort: Optional[str] = None, limit: int = 100) -> int:
+        # Прогрев кэша: первые limit документов одним запросом к elastic, в кэш - одним пайплайном
+        query = await self.storage.build_search_query(sort=sort, page_number=1, page_size=limit)
+        items = parse_obj_as(List[self.get_model()], await self.storage.search(query=query))
+        await self.cache.set_many_by_ids(items)
+        return len(items)
+
+    async def _load_search(self, query: dict, cache: ModelCache, model: Type[BaseESModel]):
+        items_data = await self.storage.search(query=query)
+        with phase('parse'):
             items = parse_obj_as(List[model], items_data)
-            await self.cache.set_by_elastic_query(query, items)
+        await cache.set_by_elastic_query(query, items)
         return items
 
+    async def load(self, instance_id: str) -> Optional[BaseESModel]:
+        # Тот же загрузчик, что у get_entry_by_id: запросы за один тик объединяются
+        return await self.get_by_id(instance_id)
+
+    async def load_many(self, ids: List[str]) -> List[Optional[BaseESModel]]:
+        entries = await get_loader(self, self._load_entries).load_many(ids)
+        return [None if entry.value is NOT_FOUND else entry.value for entry in entries]
+
     async def bulk_get_by_ids(self, ids: List[str]) -> List:
         if not ids:
             return []
-        # noinspection PyTypeChecker
-        instances = await asyncio.gather(*[self.cache.get_by_id(instance_id) for instance_id in ids])
-        instances: List[BaseESModel] = [instance for instance in instances if instance is not None]
-        instance_id_mapping = {instance.id: instance for instance in instances}
-        not_cached_ids = [instance_id for instance_id in ids if instance_id not in instance_id_mapping]
-
-        res = await self.storage.bulk_get_by_ids(not_cached_ids)
-        model = self.get_model()
-        instances.extend(parse_obj_as(List[model], res))
-        if instances:
-            await asyncio.gather(*[self.cache.set_by_id(instance.id, instance) for instance in instances])
-        if not instances:
-            return []
-        return instances
+        ids = list(dict.fromkeys(ids))
+        entries = await self._load_entries(ids)
+        return [entries[instance_id].value for instance_id in ids if entries[instance_id].value is not NOT_FOUND]
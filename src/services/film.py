@@ -41,6 +41,6 @@ def get_film_service(
         redis: AbstractCacheStorage = Depends(get_cache_storage),
         elastic: AsyncElasticsearch = Depends(get_elastic),
 ) -> FilmService:
-    return FilmService(ModelCache(Film, redis),
+    return FilmService(ModelCache(Film, redis, index='movies'),
                        ElasticSearchStorage(elastic=elastic, index='movies',
                                             query_builder=ElasticSearchFilmQueryBuilder))
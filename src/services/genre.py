@@ -1,18 +1,71 @@
+import asyncio
+from functools import cache
+from typing import List, Optional, Tuple
+
 from fastapi import Depends
+from pydantic import parse_obj_as
 
-from db.cache import ModelCache, get_cache_storage, AbstractCacheStorage
+from db.cache import NOT_FOUND, CacheEntry, ModelCache, get_cache_storage, AbstractCacheStorage
 from db.elastic import AsyncElasticsearch, get_elastic
-from db.models import Genre
-from db.storage import ElasticSearchStorage
+from db.models import FilmShort, Genre, GenrePage, GenreShort
+from db.storage import AbstractStorage, ElasticSearchStorage
 from services.base import BaseElasticSearchService
+from services.film import ElasticSearchFilmQueryBuilder
+from timing import phase
 
 
 class GenreService(BaseElasticSearchService):
     model = Genre
 
+    def __init__(self, cache: ModelCache, storage: AbstractStorage, film_storage: AbstractStorage):
+        super(GenreService, self).__init__(cache, storage)
+        self.film_storage = film_storage
+
+    async def get_entry_by_page(self, genre_id: str, page_number: int, page_size: int) -> Optional[CacheEntry]:
+        # Жанр с одной страницей фильмов: у популярных жанров их тысячи
+        page_cache = self.cache.for_model(GenrePage)
+
+        def load():
+            return self._flights.do(page_cache.page_key(genre_id, page_number, page_size),
+                                    lambda: self._load_by_page(genre_id, page_number, page_size, page_cache))
+
+        entry = await page_cache.get_entry_by_page(genre_id, page_number, page_size, refresh=load)
+        if entry is None:
+            entry = await load()
+        return None if entry.value is NOT_FOUND else entry
+
+    async def _load_by_page(self, genre_id: str, page_number: int, page_size: int,
+                            page_cache: ModelCache) -> CacheEntry:
+        genres_data, (films_data, films_total) = await asyncio.gather(
+            self.storage.bulk_get_by_ids([genre_id], source=list(GenreShort.__fields__)),
+            self._search_films(genre_id, page_number, page_size),
+        )
+        if not genres_data:
+            return await page_cache.set_not_found_by_page(genre_id, page_number, page_size)
+        with phase('parse'):
+            films = parse_obj_as(List[FilmShort], films_data)
+            genre = GenreShort.parse_obj(genres_data[0])
+            page = GenrePage(id=genre.id, name=genre.name, filmworks=films, filmworks_total=films_total)
+        return await page_cache.set_by_page(genre_id, page_number, page_size, page,
+                                            ref_ids=[film.id for film in films])
+
+    async def _search_films(self, genre_id: str, page_number: int, page_size: int) -> Tuple[List[dict], int]:
+        # Фильмы жанра берутся из индекса movies: страница ограничена index.max_result_window (10000),
+        # а не index.max_inner_result_window (100), как у inner_hits по вложенному filmworks
+        query = await self.film_storage.build_search_query(search_filter=genre_id, sort='-imdb_rating',
+                                                           page_number=page_number, page_size=page_size,
+                                                           source=list(FilmShort.__fields__))
+        # id - tiebreaker, чтобы фильмы с одинаковым рейтингом не переходили между страницами
+        query['sort'] = query['sort'] + [{'id': 'asc'}]
+        query['track_total_hits'] = True
+        return await self.film_storage.search_with_total(query)
+
 
+@cache
 def get_genre_service(
         redis: AbstractCacheStorage = Depends(get_cache_storage),
         elastic: AsyncElasticsearch = Depends(get_elastic),
 ) -> GenreService:
-    return GenreService(ModelCache(Genre, redis), ElasticSearchStorage(elastic=elastic, index='genres'))
+    return GenreService(ModelCache(Genre, redis, index='genres'), ElasticSearchStorage(elastic=elastic, index='genres'),
+                        film_storage=ElasticSearchStorage(elastic=elastic, index='movies',
+                                                          query_builder=ElasticSearchFilmQueryBuilder))
@@ -0,0 +1,55 @@
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Загрузчики текущего запроса, по одному на сервис. None - вне запроса (фоновые задачи, CLI)
+request_loaders: contextvars.ContextVar[Optional[Dict[Any, 'BatchLoader']]] = contextvars.ContextVar(
+    'request_loaders', default=None)
+
+
+class BatchLoader:
+    # Собирает id, запрошенные за один тик event loop, и загружает их одним вызовом batch_fn,
+    # который возвращает {id: результат}; id, которых нет в ответе, получают None.
+    # Результаты не запоминаются: после загрузки пачки загрузчик снова пуст.
+    def __init__(self, batch_fn: Callable[[List[str]], Awaitable[Dict[str, Any]]]) -> None:
+        self._batch_fn = batch_fn
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def load(self, instance_id: str) -> 'asyncio.Future[Optional[Any]]':
+        future = self._pending.get(instance_id)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            if not self._pending:
+                loop.call_soon(self._dispatch)
+            future = loop.create_future()
+            self._pending[instance_id] = future
+        return future
+
+    async def load_many(self, instance_ids: List[str]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*[self.load(instance_id) for instance_id in instance_ids]))
+
+    def _dispatch(self) -> None:
+        batch, self._pending = self._pending, {}
+        asyncio.ensure_future(self._resolve(batch))
+
+    async def _resolve(self, batch: Dict[str, asyncio.Future]) -> None:
+        try:
+            found = await self._batch_fn(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for instance_id, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(instance_id))
+
+
+def get_loader(key: Any, batch_fn: Callable[[List[str]], Awaitable[Dict[str, Any]]]) -> BatchLoader:
+    loaders = request_loaders.get()
+    if loaders is None:
+        return BatchLoader(batch_fn)
+    loader = loaders.get(key)
+    if loader is None:
+        loader = loaders[key] = BatchLoader(batch_fn)
+    return loader
@@ -1,26 +1,60 @@
 import logging
 from functools import cache
+from typing import List, Optional
 
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
+from pydantic import parse_obj_as
 
-from db.cache import ModelCache, get_cache_storage, AbstractCacheStorage
+from db.cache import NOT_FOUND, ModelCache, get_cache_storage, AbstractCacheStorage
 from db.elastic import get_elastic
-from db.models import Person
-from db.storage import ElasticSearchStorage
+from db.models import FilmShort, Person
+from db.storage import AbstractStorage, ElasticSearchStorage
 from services.base import BaseElasticSearchService
+from timing import phase
 
 logger = logging.getLogger(__name__)
 
+FILMOGRAPHY = 'filmography'
+
 
 class PersonService(BaseElasticSearchService):
     model = Person
 
+    def __init__(self, cache: ModelCache, storage: AbstractStorage, film_storage: AbstractStorage):
+        super(PersonService, self).__init__(cache, storage)
+        self.film_storage = film_storage
+
+    async def get_filmography(self, person_id: str) -> Optional[List[FilmShort]]:
+        # None - персоны нет, [] - персона есть, но без фильмов.
+        # Готовый список FilmShort кэшируется целиком, так что на попадании это один запрос к кэшу.
+        films_cache = self.cache.for_model(FilmShort)
+
+        def load():
+            return self._flights.do(films_cache.relation_key(FILMOGRAPHY, person_id),
+                                    lambda: self._load_filmography(person_id, films_cache))
+
+        films = await films_cache.get_by_relation(FILMOGRAPHY, person_id, refresh=load)
+        if films is None:
+            films = await load()
+        return [] if films is NOT_FOUND else films
+
+    async def _load_filmography(self, person_id: str, films_cache: ModelCache) -> Optional[List[FilmShort]]:
+        person = await self.load(person_id)
+        if not person:
+            return None
+        films_data = await self.film_storage.bulk_get_by_ids(person.film_ids, source=list(FilmShort.__fields__))
+        with phase('parse'):
+            films = parse_obj_as(List[FilmShort], films_data)
+        await films_cache.set_by_relation(FILMOGRAPHY, person_id, films)
+        return films
+
 
 @cache
 def get_person_service(
         redis: AbstractCacheStorage = Depends(get_cache_storage),
         elastic: AsyncElasticsearch = Depends(get_elastic),
 ) -> PersonService:
-    return PersonService(ModelCache(Person, redis),
-                         ElasticSearchStorage(elastic=elastic, index='persons'))
+    return PersonService(ModelCache(Person, redis, index='persons'),
+                         ElasticSearchStorage(elastic=elastic, index='persons'),
+                         film_storage=ElasticSearchStorage(elastic=elastic, index='movies'))
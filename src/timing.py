@@ -0,0 +1,56 @@
+import contextvars
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Фазы текущего запроса: имя -> [суммарное время в секундах, число вызовов]. None - замер выключен
+_phases: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar(
+    'timing_phases', default=None)
+
+
+class _Phase:
+    __slots__ = ('name', 'phases', 'started')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> '_Phase':
+        self.phases = _phases.get()
+        if self.phases is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.phases is not None:
+            stat = self.phases.setdefault(self.name, [0.0, 0])
+            stat[0] += time.perf_counter() - self.started
+            stat[1] += 1
+
+
+def phase(name: str) -> _Phase:
+    # with phase('redis'): ... - время блока добавляется к фазе, если для запроса включён замер
+    return _Phase(name)
+
+
+def start() -> Tuple[contextvars.Token, Dict[str, List[float]]]:
+    # Включает замер для текущего контекста; словарь заполняется по мере выполнения запроса
+    phases: Dict[str, List[float]] = {}
+    return _phases.set(phases), phases
+
+
+def stop(token: contextvars.Token) -> None:
+    _phases.reset(token)
+
+
+def server_timing_header(phases: Dict[str, List[float]], total: float) -> str:
+    metrics = [f'{name};dur={duration * 1000:.2f};desc="{int(count)} calls"'
+               for name, (duration, count) in phases.items()]
+    metrics.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(metrics)
+
+
+def debug_payload(phases: Dict[str, List[float]], total: float) -> dict:
+    return {
+        'total_ms': round(total * 1000, 3),
+        'phases': {name: {'ms': round(duration * 1000, 3), 'count': int(count)}
+                   for name, (duration, count) in phases.items()},
+    }
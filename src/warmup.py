@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List
+
+import config
+import db.models
+from db import cache, elastic
+from services.film import FilmService, get_film_service
+from services.genre import GenreService, get_genre_service
+from services.person import PersonService, get_person_service
+
+logger = logging.getLogger(__name__)
+
+# Выставляется после прогрева (или сразу, если прогрев выключен); по нему отвечает /health/ready
+ready = asyncio.Event()
+
+
+async def warm_up(film_service: FilmService, genre_service: GenreService, person_service: PersonService,
+                  top_films: int = config.WARMUP_TOP_FILMS, max_genres: int = config.WARMUP_MAX_GENRES,
+                  concurrency: int = config.WARMUP_CONCURRENCY) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(fn: Callable[[], Awaitable]) -> None:
+        async with semaphore:
+            await fn()
+
+    started = time.monotonic()
+    films_count = await film_service.preload(sort='-imdb_rating', limit=top_films)
+
+    # Первые страницы запросов без параметров - так открываются списки на главной
+    default_searches: List[Callable[[], Awaitable]] = [
+        lambda: film_service.search('', projection=db.models.FilmShort, page_number=1, page_size=50),
+        lambda: film_service.search('', sort='-imdb_rating', projection=db.models.FilmShort,
+                                    page_number=1, page_size=50),
+        lambda: genre_service.search('', projection=db.models.GenreShort, page_number=1, page_size=50),
+        lambda: person_service.search('', page_number=1, page_size=50),
+    ]
+    await asyncio.gather(*[limited(fn) for fn in default_searches])
+
+    genres = await genre_service.search('', projection=db.models.GenreShort, page_number=1, page_size=max_genres)
+    await asyncio.gather(*[limited(lambda genre_id=genre.id: genre_service.get_entry_by_page(genre_id, 1, 50))
+                           for genre in genres])
+    logger.info(f'Cache warmed up in {time.monotonic() - started:.1f}s: '
+                f'{films_count} films, {len(genres)} genres, {len(default_searches)} searches')
+
+
+async def warm_up_default_services() -> None:
+    storage = await cache.get_cache_storage()
+    await warm_up(get_film_service(storage, elastic.es), get_genre_service(storage, elastic.es),
+                  get_person_service(storage, elastic.es))
+
+
+async def warm_up_in_background() -> None:
+    # Ошибка прогрева не должна держать сервис неготовым: отвечать с холодным кэшем лучше, чем не отвечать
+    try:
+        await warm_up_default_services()
+    except Exception:
+        logger.exception('Cache warm-up failed')
+    finally:
+        ready.set()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Прогрев кэша Redis после деплоя или сброса')
+    parser.add_argument('--top-films', type=int, default=config.WARMUP_TOP_FILMS)
+    parser.add_argument('--max-genres', type=int, default=config.WARMUP_MAX_GENRES)
+    parser.add_argument('--concurrency', type=int, default=config.WARMUP_CONCURRENCY)
+    args = parser.parse_args()
+
+    storage = await cache.get_cache_storage()
+    elastic.es = elastic.create_elastic()
+    try:
+        await warm_up(get_film_service(storage, elastic.es), get_genre_service(storage, elastic.es),
+                      get_person_service(storage, elastic.es),
+                      top_films=args.top_films, max_genres=args.max_genres, concurrency=args.concurrency)
+    finally:
+        await storage.close()
+        await elastic.es.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+import db.models
+from db.cache import LocalCache, ModelCache, query_fingerprint
+
+
+def make_cache(model, index: str) -> ModelCache:
+    return ModelCache(model, storage=None, local=LocalCache(maxsize=0), index=index)
+
+
+def test_query_key_ignores_key_order():
+    # GIVEN the same query built with keys in different order
+    query = {'query': {'bool': {'must': [{'match': {'title': 'star'}}], 'filter': [{'term': {'id': '1'}}]}},
+             'from': 0, 'size': 50, '_source': ['id', 'title']}
+    reordered = {'_source': ['id', 'title'], 'size': 50, 'from': 0,
+                 'query': {'bool': {'filter': [{'term': {'id': '1'}}], 'must': [{'match': {'title': 'star'}}]}}}
+    films = make_cache(db.models.FilmShort, 'movies')
+
+    # THEN it gets the same key, while list order and values still matter
+    assert query_fingerprint(query) == query_fingerprint(reordered)
+    assert films.query_key(query) == films.query_key(reordered)
+    assert films.query_key(query) != films.query_key({**query, '_source': ['title', 'id']})
+    assert films.query_key(query) != films.query_key({**query, 'from': 50})
+
+    # AND the key is namespaced by model and index
+    assert films.query_key(query) == f'FilmShort:query:movies:{query_fingerprint(query)}'
+    assert films.query_key(query) != make_cache(db.models.Film, 'movies').query_key(query)
+    assert films.query_key(query) != make_cache(db.models.FilmShort, 'genres').query_key(query)
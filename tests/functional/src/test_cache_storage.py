@@ -0,0 +1,110 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+
+from db.cache import RedisCacheStorage, ShardedCacheStorage
+
+KEYS = [f'Film:id:{i}' for i in range(1000)]
+
+
+class MemoryNode:
+    # Узел кэша в памяти: хватает для проверки маршрутизации ключей
+    def __init__(self) -> None:
+        self.data: Dict[str, str] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        return self.data.get(key)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return [self.data.get(key) for key in keys]
+
+    async def set_many(self, items: Dict[str, str], ttl: Optional[int] = None) -> None:
+        self.data.update(items)
+
+
+class CountingRedis:
+    # Считает обращения к Redis, чтобы проверить склейку GET в MGET
+    def __init__(self, data: Dict[str, str]) -> None:
+        self.data = data
+        self.calls: List[tuple] = []
+
+    async def get(self, key: str) -> Optional[str]:
+        self.calls.append(('get', key))
+        return self.data.get(key)
+
+    async def mget(self, *keys: str) -> List[Optional[str]]:
+        self.calls.append(('mget', *keys))
+        return [self.data.get(key) for key in keys]
+
+
+def test_sharded_ring_is_stable():
+    # GIVEN a ring of three nodes
+    nodes = [MemoryNode() for _ in range(3)]
+    storage = ShardedCacheStorage(nodes)
+    placement = [nodes.index(storage.node_for(key)) for key in KEYS]
+
+    # THEN placement does not change between instances and all nodes get keys
+    assert placement == [nodes.index(ShardedCacheStorage(nodes).node_for(key)) for key in KEYS]
+    assert set(placement) == {0, 1, 2}
+
+    # WHEN a fourth node is added
+    new_node = MemoryNode()
+    grown = ShardedCacheStorage(nodes + [new_node])
+    moved = [key for key, node in zip(KEYS, placement) if grown.node_for(key) is not nodes[node]]
+
+    # THEN only keys moved to the new node change place, about a quarter of them
+    assert all(grown.node_for(key) is new_node for key in moved)
+    assert 0.1 < len(moved) / len(KEYS) < 0.4
+
+
+@pytest.mark.asyncio
+async def test_sharded_get_many_keeps_order():
+    # GIVEN keys written through the ring to different nodes
+    nodes = [MemoryNode() for _ in range(3)]
+    storage = ShardedCacheStorage(nodes)
+    await storage.set_many({key: f'value {key}' for key in KEYS[:100]})
+    assert all(node.data for node in nodes)
+
+    # WHEN they are read in shuffled order with missing keys in between
+    keys = KEYS[99::-3] + ['Film:id:missing'] + KEYS[:50:7]
+    values = await storage.get_many(keys)
+
+    # THEN values come back in the order of the keys
+    assert values == [None if key == 'Film:id:missing' else f'value {key}' for key in keys]
+
+
+@pytest.mark.asyncio
+async def test_auto_pipeline_merges_gets():
+    # GIVEN storage with auto-pipelining
+    redis = CountingRedis({'a': '1', 'b': '2'})
+    storage = RedisCacheStorage(redis, auto_pipeline=True)
+
+    # WHEN GETs arrive in the same tick, one key twice
+    values = await asyncio.gather(storage.get('a'), storage.get('b'), storage.get('a'), storage.get('missing'))
+
+    # THEN they are sent as one MGET without duplicates
+    assert values == ['1', '2', '1', None]
+    assert redis.calls == [('mget', 'a', 'b', 'missing')]
+
+    # WHEN the next GET comes in a later tick
+    assert await storage.get('b') == '2'
+
+    # THEN it makes a new MGET
+    assert redis.calls == [('mget', 'a', 'b', 'missing'), ('mget', 'b')]
+
+
+@pytest.mark.asyncio
+async def test_auto_pipeline_propagates_errors():
+    # GIVEN storage with auto-pipelining over a failing Redis
+    class FailingRedis(CountingRedis):
+        async def mget(self, *keys: str) -> List[Optional[str]]:
+            raise ConnectionError('redis is down')
+
+    storage = RedisCacheStorage(FailingRedis({}), auto_pipeline=True)
+
+    # WHEN GETs arrive in the same tick
+    results = await asyncio.gather(storage.get('a'), storage.get('b'), return_exceptions=True)
+
+    # THEN every caller gets the error
+    assert all(isinstance(result, ConnectionError) for result in results)
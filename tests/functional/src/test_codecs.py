@@ -0,0 +1,77 @@
+import orjson
+import pytest
+
+import db.models
+from db.cache import LocalCache, ModelCache
+from db.codecs import COMPRESSOR_IDS, SERIALIZER_IDS, CacheCodec, CodecError
+
+VALUE = {'e': 1700000000.5, 'h': 'etag', 'v': [{'id': str(i), 'title': 'Star Wars ' * 20, 'imdb_rating': 7.5}
+                                               for i in range(20)]}
+
+
+@pytest.mark.parametrize('serializer', sorted(SERIALIZER_IDS))
+@pytest.mark.parametrize('compression', sorted(COMPRESSOR_IDS))
+def test_codec_round_trip(serializer: str, compression: str):
+    # GIVEN a codec for every available serializer and compression
+    codec = CacheCodec(serializer, compression, threshold=64)
+
+    # WHEN a value is encoded and decoded
+    data = codec.encode(VALUE)
+
+    # THEN it comes back unchanged, and long values are compressed
+    assert CacheCodec.decode(data) == VALUE
+    if compression != 'none':
+        assert len(data) < len(orjson.dumps(VALUE))
+
+
+def test_codec_skips_compression_below_threshold():
+    # GIVEN a short value
+    codec = CacheCodec('json', 'zlib', threshold=1024)
+
+    # WHEN it is encoded
+    data = codec.encode({'n': 1})
+
+    # THEN only the version byte is added
+    assert data == bytes([SERIALIZER_IDS['json']]) + orjson.dumps({'n': 1})
+
+
+def test_codec_reads_other_codec_values():
+    # GIVEN a value written with another codec (e.g. before CACHE_COMPRESSION changed)
+    data = CacheCodec('json', 'zlib', threshold=0).encode(VALUE)
+
+    # THEN any codec decodes it by its version byte
+    assert CacheCodec('json', 'none').decode(data) == VALUE
+
+
+def test_codec_decodes_legacy_json():
+    # GIVEN a value written before codecs, as plain JSON
+    data = orjson.dumps(VALUE)
+
+    # THEN it is decoded as JSON
+    assert CacheCodec.decode(data) == VALUE
+
+
+@pytest.mark.parametrize('data', [b'', b'\x0f{}', b'\x11not zlib'])
+def test_codec_rejects_unknown_values(data: bytes):
+    with pytest.raises(CodecError):
+        CacheCodec.decode(data)
+
+
+class MemoryStorage:
+    def __init__(self, data: dict) -> None:
+        self.data = data
+
+    async def get(self, key: str):
+        return self.data.get(key)
+
+
+@pytest.mark.asyncio
+async def test_legacy_cache_entry_is_a_miss():
+    # GIVEN a film cached before the envelope format: the model JSON itself
+    film = db.models.FilmShort(id='3d825f60-9fff-4dfe-b294-1a45fa1e115d', title='Star Wars', imdb_rating=7.5)
+    cache = ModelCache(db.models.FilmShort, MemoryStorage({}), local=LocalCache(maxsize=0), index='movies')
+    cache.storage.data[cache.id_key(film.id)] = film.json().encode()
+
+    # WHEN it is read
+    # THEN it is treated as a miss, so the film is loaded again instead of failing the request
+    assert await cache.get_by_id(film.id) is None
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+from elasticsearch import AsyncElasticsearch
+
+from db.models import Film, Genre, Person
+from etl.extract import sqlite_source
+from etl.main import run
+
+FILM_ID = 'e1000000-0000-4000-8000-000000000001'
+OTHER_FILM_ID = 'e1000000-0000-4000-8000-000000000002'
+ACTOR_ID = 'e2000000-0000-4000-8000-000000000001'
+DIRECTOR_ID = 'e2000000-0000-4000-8000-000000000002'
+GENRE_ID = 'e3000000-0000-4000-8000-000000000001'
+
+SCHEMA = '''
+CREATE TABLE film_work (id TEXT PRIMARY KEY, title TEXT NOT NULL, description TEXT, rating REAL);
+CREATE TABLE person (id TEXT PRIMARY KEY, full_name TEXT NOT NULL);
+CREATE TABLE genre (id TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE person_film_work (id TEXT PRIMARY KEY, film_work_id TEXT, person_id TEXT, role TEXT NOT NULL);
+CREATE TABLE genre_film_work (id TEXT PRIMARY KEY, film_work_id TEXT, genre_id TEXT);
+'''
+
+
+@pytest.fixture
+async def etl_source(tmp_path, es_client: AsyncElasticsearch):
+    path = str(tmp_path / 'movies.sqlite')
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    connection.executemany('INSERT INTO film_work VALUES (?, ?, ?, ?)', [
+        (FILM_ID, 'Etl Loaded Film', 'Loaded from SQLite', 7.7),
+        (OTHER_FILM_ID, 'Etl Second Film', None, None),
+    ])
+    connection.executemany('INSERT INTO person VALUES (?, ?)', [(ACTOR_ID, 'Etl Actor'), (DIRECTOR_ID, 'Etl Director')])
+    connection.execute('INSERT INTO genre VALUES (?, ?)', (GENRE_ID, 'Etl Genre'))
+    connection.executemany('INSERT INTO person_film_work VALUES (?, ?, ?, ?)', [
+        ('p1', FILM_ID, ACTOR_ID, 'actor'),
+        ('p2', FILM_ID, DIRECTOR_ID, 'director'),
+        ('p3', OTHER_FILM_ID, ACTOR_ID, 'actor'),
+        ('p4', OTHER_FILM_ID, ACTOR_ID, 'writer'),
+    ])
+    connection.execute('INSERT INTO genre_film_work VALUES (?, ?, ?)', ('g1', FILM_ID, GENRE_ID))
+    connection.commit()
+    connection.close()
+
+    source = sqlite_source(path, fetch_size=1)
+    yield source
+    await source.close()
+    for index, ids in (('movies', [FILM_ID, OTHER_FILM_ID]), ('persons', [ACTOR_ID, DIRECTOR_ID]),
+                       ('genres', [GENRE_ID])):
+        for instance_id in ids:
+            await es_client.delete(index, instance_id, refresh='wait_for', ignore=404)
+
+
+@pytest.mark.asyncio
+async def test_etl_full_load(make_get_request, es_client: AsyncElasticsearch, etl_source):
+    stats = await run(etl_source, es_client, chunk_size=2, concurrency=2, queue_size=2)
+
+    assert [(result.index, result.loaded, result.failed) for result in stats] == [
+        ('movies', 2, 0), ('persons', 2, 0), ('genres', 1, 0)]
+
+    film = Film.parse_obj((await es_client.get('movies', FILM_ID))['_source'])
+    assert film.imdb_rating == 7.7
+    assert film.actors_names == ['Etl Actor']
+    assert film.directors_names == ['Etl Director']
+    assert film.writers == []
+    assert film.genres_names == ['Etl Genre']
+
+    actor = Person.parse_obj((await es_client.get('persons', ACTOR_ID))['_source'])
+    assert sorted(actor.roles) == ['actor', 'writer']
+    assert sorted(actor.film_ids) == [FILM_ID, OTHER_FILM_ID]
+
+    genre = Genre.parse_obj((await es_client.get('genres', GENRE_ID))['_source'])
+    assert [filmwork.id for filmwork in genre.filmworks] == [FILM_ID]
+
+    response = await make_get_request(f'/film/{FILM_ID}')
+    assert response.status == 200
+    assert response.body['title'] == 'Etl Loaded Film'
@@ -12,6 +12,7 @@ from starlette import status
 
 import api_v1.models
 import db.models
+from db.cache import LocalCache, ModelCache, RedisCacheStorage
 
 
 @pytest.fixture(scope='module')
@@ -33,10 +34,32 @@ async def genres(es_client):
         db.models.Genre(id='59e89fb7-639c-41fa-b829-a9261bad1114', name='Documentary', filmworks=documentary_films),
         db.models.Genre(id='9854793d-bb4f-45bf-8b2f-934bbf42adc9', name='Horror', filmworks=horror_films),
     ]
+    # Фильмы жанра API берёт из индекса movies, поэтому они индексируются вместе с жанрами
+    films = {}
+    for genre in genres:
+        for film in genre.filmworks:
+            films.setdefault(film.id, db.models.Film(
+                id=film.id, title=film.title, imdb_rating=film.imdb_rating, actors_names=[], writers_names=[],
+                directors_names=[], genres_names=[], actors=[], writers=[], directors=[], genres=[],
+            ))
+            films[film.id].genres.append(db.models.IdName(id=genre.id, name=genre.name))
+            films[film.id].genres_names.append(genre.name)
     create_genres_coros = [es_client.index('genres', id=genre.id, body=genre.dict(), refresh='wait_for')
                            for genre in genres]
-    await asyncio.gather(*create_genres_coros)
-    return genres
+    create_films_coros = [es_client.index('movies', id=film.id, body=film.dict(), refresh='wait_for')
+                          for film in films.values()]
+    await asyncio.gather(*create_genres_coros, *create_films_coros)
+    yield genres
+    await asyncio.gather(*[es_client.delete('movies', film_id, refresh='wait_for', ignore=404) for film_id in films])
+
+
+def genre_page(genre: db.models.Genre, page_number: int = 1, page_size: int = 50) -> db.models.GenrePage:
+    # Фильмы жанра отдаются по убыванию рейтинга, при равном рейтинге - по id
+    films = sorted(genre.filmworks, key=attrgetter('id'))
+    films = sorted(films, key=lambda film: film.imdb_rating or 0, reverse=True)
+    start = (page_number - 1) * page_size
+    return db.models.GenrePage(id=genre.id, name=genre.name, filmworks=films[start:start + page_size],
+                               filmworks_total=len(films))
 
 
 # noinspection PyUnusedLocal
@@ -97,11 +120,12 @@ async def test_genres_query_in_cache(session: aiohttp.ClientSession, es_client:
     first_two_genres_response = await make_get_request('/genre/',
                                                        {'page[size]': page_size, 'page[number]': page_number})
     received_api_models = pydantic.parse_obj_as(List[api_v1.models.Genre], first_two_genres_response.body)
-    redis_key = "Genre:query:{'from': 0, 'size': 2}"
     print("query keys ", await redis.keys('*'))
-    cached_value = await redis.get(redis_key)
-    assert cached_value
-    cached_models = pydantic.parse_raw_as(List[db.models.Genre], cached_value)
+    # LocalCache(maxsize=0) - читаем только из Redis
+    model_cache = ModelCache(db.models.GenreShort, RedisCacheStorage(redis), local=LocalCache(maxsize=0),
+                             index='genres')
+    cached_models = await model_cache.get_by_elastic_query({'from': 0, 'size': 2, '_source': ['id', 'name']})
+    assert cached_models
     assert received_api_models == [api_v1.models.Genre.from_db_model(genre) for genre in cached_models]
 
 
@@ -112,13 +136,13 @@ async def test_genres_id_in_cache(session: aiohttp.ClientSession, es_client: Asy
     # GIVEN some genres
     genre_response = await make_get_request('/genre/5017d3c9-3cb5-4cd1-a329-3c99a253bcf3')
     received_api_model = pydantic.parse_obj_as(api_v1.models.GenreDetail, genre_response.body)
-    redis_key = "Genre:id:5017d3c9-3cb5-4cd1-a329-3c99a253bcf3"
     print("id keys ", await redis.keys('*'))
 
-    cached_value = await redis.get(redis_key)
-    assert cached_value
-    cached_model = pydantic.parse_raw_as(db.models.Genre, cached_value)
-    assert received_api_model == api_v1.models.GenreDetail.from_db_model(cached_model)
+    model_cache = ModelCache(db.models.GenrePage, RedisCacheStorage(redis), local=LocalCache(maxsize=0),
+                             index='genres')
+    cached_entry = await model_cache.get_entry_by_page('5017d3c9-3cb5-4cd1-a329-3c99a253bcf3', 1, 50)
+    assert cached_entry
+    assert received_api_model == api_v1.models.GenreDetail.from_db_model(cached_entry.value)
 
 
 # noinspection PyUnusedLocal
@@ -129,10 +153,49 @@ async def test_genres_id(session: aiohttp.ClientSession, es_client: AsyncElastic
 
     # THEN only that genre is returned
     received = pydantic.parse_obj_as(api_v1.models.GenreDetail, action_genre.body)
-    expected = [api_v1.models.GenreDetail.from_db_model(genre) for genre in genres if genre.name == 'Action'][0]
+    expected = [api_v1.models.GenreDetail.from_db_model(genre_page(genre)) for genre in genres
+                if genre.name == 'Action'][0]
     assert expected == received
 
 
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_genres_id_filmworks_by_rating(session: aiohttp.ClientSession, es_client: AsyncElasticsearch,
+                                             make_get_request, genres):
+    # WHEN queries for genre whose films are indexed in ascending rating order
+    documentary_genre = await make_get_request('/genre/59e89fb7-639c-41fa-b829-a9261bad1114')
+
+    # THEN films are returned by rating DESC with the total number of genre films
+    received = pydantic.parse_obj_as(api_v1.models.GenreDetail, documentary_genre.body)
+    assert [film.uuid for film in received.filmworks] == ['a5a69721-a1ba-4d74-a1f9-905ddaac0eed',
+                                                          '0c13e610-84f3-4573-9301-2df5235fe627']
+    assert received.filmworks_total == 2
+
+
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_genres_id_filmworks_paging(session: aiohttp.ClientSession, es_client: AsyncElasticsearch,
+                                          make_get_request, genres):
+    # WHEN queries for the second page of genre filmworks
+    action_genre = await make_get_request('/genre/5017d3c9-3cb5-4cd1-a329-3c99a253bcf3',
+                                          {'page[size]': 1, 'page[number]': 2})
+
+    # THEN only the second film of that genre is returned
+    received = pydantic.parse_obj_as(api_v1.models.GenreDetail, action_genre.body)
+    assert received.name == 'Action'
+    assert [film.uuid for film in received.filmworks] == ['c66258d4-9a34-47d0-85cc-5d4584090207']
+    assert received.filmworks_total == 2
+
+
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_genres_id_filmworks_paging_unavailable(session: aiohttp.ClientSession, es_client: AsyncElasticsearch,
+                                                      make_get_request, genres):
+    # WHEN queries for genre filmworks past the elastic result window
+    r = await make_get_request('/genre/5017d3c9-3cb5-4cd1-a329-3c99a253bcf3', {'page[size]': 100, 'page[number]': 101})
+    assert r.status == status.HTTP_400_BAD_REQUEST
+
+
 # noinspection PyUnusedLocal
 @pytest.mark.asyncio
 async def test_genres_paging_last(session: aiohttp.ClientSession, es_client: AsyncElasticsearch, make_get_request,
@@ -0,0 +1,140 @@
+import asyncio
+import uuid
+from typing import Dict, List, Optional
+
+import aioredis
+import pytest
+
+import db.models
+from db.cache import NOT_FOUND, LocalCache, ModelCache, RedisCacheStorage
+from services.loader import BatchLoader, request_loaders
+from services.person import PersonService
+
+
+def make_film(film_id: str) -> db.models.FilmShort:
+    return db.models.FilmShort(id=film_id, title=f'Film {film_id}', imdb_rating=5.0)
+
+
+class CountingCacheStorage(RedisCacheStorage):
+    def __init__(self, redis: aioredis.Redis) -> None:
+        super().__init__(redis)
+        self.gets: List[List[str]] = []
+
+    async def get(self, key: str) -> Optional[str]:
+        self.gets.append([key])
+        return await super().get(key)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        self.gets.append(keys)
+        return await super().get_many(keys)
+
+
+class PersonStorage:
+    # Хранилище персон: считает обращения к elastic
+    def __init__(self, persons: List[db.models.Person]) -> None:
+        self.persons = {person.id: person for person in persons}
+        self.calls: List[List[str]] = []
+
+    async def bulk_get_by_ids(self, ids: List[str], source: Optional[List[str]] = None) -> List[dict]:
+        self.calls.append(ids)
+        await asyncio.sleep(0)
+        return [self.persons[person_id].dict() for person_id in ids if person_id in self.persons]
+
+
+@pytest.mark.asyncio
+async def test_loader_batches_one_tick():
+    # GIVEN a loader over a counting batch function
+    batches = []
+
+    async def batch_fn(ids: List[str]) -> Dict[str, db.models.FilmShort]:
+        batches.append(ids)
+        return {film_id: make_film(film_id) for film_id in ids if film_id != 'missing'}
+
+    loader = BatchLoader(batch_fn)
+
+    # WHEN several ids, one of them twice, are requested in the same tick
+    results = await asyncio.gather(loader.load('a'), loader.load('b'), loader.load('a'), loader.load('missing'))
+
+    # THEN they are loaded with one call, without duplicates, and missing ids resolve to None
+    assert batches == [['a', 'b', 'missing']]
+    assert [film.id if film else None for film in results] == ['a', 'b', 'a', None]
+
+    # WHEN the next tick requests more ids
+    await loader.load_many(['c', 'd'])
+
+    # THEN they make a new batch
+    assert batches == [['a', 'b', 'missing'], ['c', 'd']]
+
+
+@pytest.mark.asyncio
+async def test_loader_propagates_errors():
+    # GIVEN a loader whose batch function fails
+    async def batch_fn(ids: List[str]) -> Dict[str, db.models.FilmShort]:
+        raise ConnectionError('elastic is down')
+
+    loader = BatchLoader(batch_fn)
+
+    # WHEN ids are requested in the same tick
+    results = await asyncio.gather(loader.load('a'), loader.load('b'), return_exceptions=True)
+
+    # THEN every waiter gets the error
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_service_lookups_share_one_mget(redis: aioredis.Redis):
+    # GIVEN a service inside a request scope, with one person cached and two not
+    persons = [db.models.Person(id=str(uuid.uuid4()), full_name=f'Person {i}', roles=['actor'], film_ids=[])
+               for i in range(3)]
+    missing_id = str(uuid.uuid4())
+    cache_storage = CountingCacheStorage(redis)
+    storage = PersonStorage(persons)
+    service = PersonService(ModelCache(db.models.Person, cache_storage, local=LocalCache(maxsize=0), index='persons'),
+                            storage, film_storage=None)
+    await service.cache.set_by_id(persons[0].id, persons[0])
+    token = request_loaders.set({})
+    try:
+        # WHEN detail lookups, load and load_many run concurrently in one tick
+        entry, loaded, many = await asyncio.gather(
+            service.get_entry_by_id(persons[0].id),
+            service.load(persons[1].id),
+            service.load_many([persons[2].id, missing_id]),
+        )
+    finally:
+        request_loaders.reset(token)
+
+    # THEN they are resolved with one Redis MGET and one elastic mget for the ids that were not cached
+    assert cache_storage.gets == [[service.cache.id_key(person.id) for person in persons]
+                                  + [service.cache.id_key(missing_id)]]
+    assert storage.calls == [[persons[1].id, persons[2].id, missing_id]]
+    assert entry.value == persons[0]
+    assert loaded == persons[1]
+    assert many == [persons[2], None]
+
+    # AND the missing id is cached as not found
+    assert (await service.cache.get_entry_by_id(missing_id)).value is NOT_FOUND
+    await redis.delete(*[service.cache.id_key(person.id) for person in persons], service.cache.id_key(missing_id))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_fetch(redis: aioredis.Redis):
+    # GIVEN two requests missing the same person at the same time
+    person = db.models.Person(id=str(uuid.uuid4()), full_name='Person', roles=['actor'], film_ids=[])
+    storage = PersonStorage([person])
+    service = PersonService(ModelCache(db.models.Person, RedisCacheStorage(redis), local=LocalCache(maxsize=0),
+                                       index='persons'), storage, film_storage=None)
+
+    async def request() -> db.models.Person:
+        token = request_loaders.set({})
+        try:
+            return await service.get_by_id(person.id)
+        finally:
+            request_loaders.reset(token)
+
+    # WHEN they run concurrently
+    results = await asyncio.gather(request(), request())
+
+    # THEN elastic is asked once
+    assert results == [person, person]
+    assert storage.calls == [[person.id]]
+    await redis.delete(service.cache.id_key(person.id))
@@ -0,0 +1,101 @@
+import aioredis
+import pytest
+
+import db.models
+from db import cache, invalidation
+from db.cache import LocalCache, ModelCache, RedisCacheStorage
+
+FILM_ID = '5e3c2f1a-8d0b-4f4e-9a63-6d1f2b7c9e10'
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_lru_eviction_order():
+    # GIVEN a full cache where 'a' was read after 'b'
+    local = LocalCache(maxsize=2)
+    local.set('a', 1)
+    local.set('b', 2)
+    assert local.get('a') == 1
+
+    # WHEN a third key is added
+    local.set('c', 3)
+
+    # THEN the least recently used key is evicted
+    assert local.get('b') is None
+    assert local.get('a') == 1
+    assert local.get('c') == 3
+    assert len(local) == 2
+
+
+def test_ttl_expiry(clock: Clock):
+    # GIVEN a key with ttl=10
+    local = LocalCache(maxsize=10, ttl=10)
+    local.set('a', 1)
+
+    # THEN it is served until the ttl passes and then dropped
+    clock.now += 10
+    assert local.get('a') == 1
+    clock.now += 0.1
+    assert local.get('a') is None
+    assert len(local) == 0
+    assert local.stats() == {'size': 0, 'maxsize': 10, 'hits': 1, 'misses': 1}
+
+
+def test_disabled_with_zero_size():
+    # GIVEN maxsize=0
+    local = LocalCache(maxsize=0)
+
+    # WHEN a key is set
+    local.set('a', 1)
+
+    # THEN nothing is stored
+    assert local.get('a') is None
+    assert len(local) == 0
+
+
+def test_invalidate():
+    local = LocalCache(maxsize=10)
+    local.set('a', 1)
+    local.set('b', 2)
+
+    local.invalidate('a', 'missing')
+
+    assert local.get('a') is None
+    assert local.get('b') == 2
+
+
+@pytest.mark.asyncio
+async def test_model_cache_with_local_tier(redis: aioredis.Redis, monkeypatch):
+    # GIVEN a model cache with L1 enabled in front of Redis, registered for invalidation
+    local = LocalCache(maxsize=10, ttl=60)
+    monkeypatch.setitem(cache.local_caches, db.models.Film.__name__, local)
+    storage = RedisCacheStorage(redis)
+    model_cache = ModelCache(db.models.Film, storage, local=local, index='movies')
+    film = db.models.Film(id=FILM_ID, title='Star Wars', imdb_rating=8.6, actors_names=[], writers_names=[],
+                          directors_names=[], genres_names=[], actors=[], writers=[], directors=[], genres=[])
+    await model_cache.set_by_id(FILM_ID, film)
+
+    # WHEN the Redis copy is gone
+    await redis.delete(model_cache.id_key(FILM_ID))
+
+    # THEN the film is still served from L1
+    assert await model_cache.get_by_id(FILM_ID) == film
+
+    # WHEN the film is invalidated
+    await invalidation.invalidate(storage, 'movies', [FILM_ID], publish=False)
+
+    # THEN L1 is cleared too
+    assert await model_cache.get_by_id(FILM_ID) is None
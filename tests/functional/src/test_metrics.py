@@ -0,0 +1,78 @@
+from typing import Dict
+
+import aiohttp
+import pytest
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+from starlette import status
+
+import main
+from middleware import MetricsMiddleware
+
+FILM_ROUTE = '/v1/film/{film_id:uuid}'
+
+
+def samples(text: str) -> Dict[str, list]:
+    # Имя ряда -> список пар (метки, значение)
+    found: Dict[str, list] = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            found.setdefault(sample.name, []).append((sample.labels, sample.value))
+    return found
+
+
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_metrics_endpoint(session: aiohttp.ClientSession, settings, make_get_request, films):
+    # GIVEN a film requested twice
+    film_id = films[0].id
+    assert (await make_get_request(f'/film/{film_id}')).status == status.HTTP_200_OK
+    await make_get_request(f'/film/{film_id}')
+
+    # WHEN metrics are scraped
+    async with session.get(settings.api_host + '/metrics') as response:
+        assert response.status == status.HTTP_200_OK
+        metrics = samples(await response.text())
+
+    # THEN request durations are labelled by route template, not by the raw path
+    routes = {labels['route'] for labels, _ in metrics['http_request_duration_seconds_count']}
+    assert FILM_ROUTE in routes
+    assert not any(film_id in route for route in routes)
+    film_requests = [value for labels, value in metrics['http_request_duration_seconds_count']
+                     if labels == {'method': 'GET', 'route': FILM_ROUTE, 'status': '200'}]
+    assert film_requests and film_requests[0] >= 2
+
+    # AND model cache hits and misses are counted
+    film_cache = {labels['result']: value for labels, value in metrics['cache_requests_total']
+                  if labels['model'] == 'Film'}
+    assert film_cache.get('miss', 0) >= 1
+    assert film_cache.get('hit', 0) >= 1
+
+    # AND the in-process cache series are exported per model
+    for name in ('local_cache_hits_total', 'local_cache_misses_total', 'local_cache_size'):
+        assert 'Film' in {labels['model'] for labels, _ in metrics[name]}
+
+
+@pytest.mark.asyncio
+async def test_route_without_endpoint():
+    # GIVEN a response sent before the router runs, as the response cache does
+    async def cached_response(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'{}'})
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        pass
+
+    labels = {'method': 'GET', 'route': FILM_ROUTE, 'status': '200'}
+    before = REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) or 0
+    scope = {'type': 'http', 'method': 'GET', 'path': '/v1/film/a9dc6ac4-2a83-4fa2-9eaa-1b5d0d6b3cd0',
+             'query_string': b'', 'headers': [], 'app': main.app}
+
+    # WHEN it goes through the metrics middleware
+    await MetricsMiddleware(cached_response)(scope, receive, send)
+
+    # THEN it is labelled with the route the path matches
+    assert REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) == before + 1
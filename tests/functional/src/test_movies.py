@@ -1,7 +1,11 @@
+import asyncio
+
+import orjson
 from aioredis import Redis
 import pytest
 from api_v1.models import FilmShort, FilmDetails
 from db.models import Film
+import config
 
 API_URL = '/film/'
 
@@ -104,6 +108,39 @@ async def test_paging_invalid_page_size(make_get_request, films):
     assert response_films_star_trek.status == 422
 
 
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_cursor_paging(make_get_request, films):
+    received_ids = []
+    cursor = ''
+    while cursor is not None:
+        response = await make_get_request(API_URL, {'query': 'Star', 'page[size]': 3, 'cursor': cursor})
+        assert response.status == 200
+        received_ids.extend(film['uuid'] for film in response.body)
+        cursor = response.headers.get('X-Next-Cursor')
+
+    assert sorted(received_ids) == sorted(film.id for film in films)
+
+
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_invalid_cursor(make_get_request, films):
+    response = await make_get_request(API_URL, {'query': 'Star', 'cursor': '!'})
+    assert response.status == 400
+
+
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_export(session, settings, films):
+    async with session.get(settings.api_host + '/v1/film/export', params={'batch_size': 3}) as response:
+        assert response.status == 200
+        assert response.headers['Content-Type'].startswith('application/x-ndjson')
+        exported_ids = [orjson.loads(line)['id'] async for line in response.content if line.strip()]
+
+    assert len(exported_ids) == len(set(exported_ids))
+    assert {film.id for film in films} <= set(exported_ids)
+
+
 @pytest.mark.asyncio
 async def test_all_search(make_get_request):
     response_films_star_trek = await make_get_request(API_URL, {'query': 'Star'})
@@ -134,6 +171,46 @@ async def test_detailed_info(make_get_request, films):
     assert received_film == expected_film
 
 
+@pytest.mark.asyncio
+async def test_detailed_info_not_modified(session, settings, films):
+    url = f'{settings.api_host}/v1{API_URL}{films[0].id}'
+    async with session.get(url) as response:
+        assert response.status == 200
+        etag = response.headers['ETag']
+        assert 'max-age' in response.headers['Cache-Control']
+
+    async with session.get(url, headers={'If-None-Match': etag}) as response:
+        assert response.status == 304
+        assert response.headers['ETag'] == etag
+        assert not await response.read()
+
+
+@pytest.mark.asyncio
+async def test_detailed_info_invalidated(make_get_request, es_client, redis: Redis, films):
+    film = films[0]
+
+    async def update_and_publish(title: str) -> None:
+        await es_client.update('movies', film.id, body={'doc': {'title': title}}, refresh='wait_for')
+        await redis.publish(config.CACHE_INVALIDATION_CHANNEL, orjson.dumps({'index': 'movies', 'ids': [film.id]}))
+
+    async def wait_for_title(title: str) -> str:
+        for _ in range(20):
+            response = await make_get_request(f'{API_URL}{film.id}')
+            if response.body['title'] == title:
+                break
+            await asyncio.sleep(0.1)
+        return response.body['title']
+
+    response = await make_get_request(f'{API_URL}{film.id}')
+    assert response.body['title'] == film.title
+
+    await update_and_publish('Invalidated title')
+    assert await wait_for_title('Invalidated title') == 'Invalidated title'
+
+    await update_and_publish(film.title)
+    assert await wait_for_title(film.title) == film.title
+
+
 @pytest.mark.asyncio
 async def test_get_film_unknown_id(make_get_request):
     response_not_found = await make_get_request('/film/6bcc7f85-9e5d-45a9-91ec-25903212c8b7')
@@ -152,8 +229,8 @@ async def test_get_film_invalid_id(make_get_request):
 @pytest.mark.asyncio
 async def test_redis_cache(make_get_request, redis: Redis):
     await redis.flushall()
-    assert not (await redis.keys("Film:query:*"))
+    assert not (await redis.keys("FilmShort:query:*"))
     response = await make_get_request(API_URL, {'query': 'Trek'})
 
     assert response.status == 200
-    assert await redis.keys("Film:query:*")
+    assert await redis.keys("FilmShort:query:*")
@@ -0,0 +1,94 @@
+import uuid
+from typing import List, Optional
+
+import aioredis
+import pytest
+
+import db.models
+from db.cache import NOT_FOUND, LocalCache, ModelCache, RedisCacheStorage
+from services.person import PersonService
+
+NEGATIVE_TTL = 30
+
+
+class PersonStorage:
+    # Хранилище персон: считает обращения к elastic
+    def __init__(self, persons: List[db.models.Person]) -> None:
+        self.persons = {person.id: person for person in persons}
+        self.calls: List[tuple] = []
+
+    async def bulk_get_by_ids(self, ids: List[str], source: Optional[List[str]] = None) -> List[dict]:
+        self.calls.append(('mget', ids))
+        return [self.persons[person_id].dict() for person_id in ids if person_id in self.persons]
+
+    async def build_search_query(self, search_query: str = '', *args, **kwargs) -> dict:
+        return {'query': {'match': {'full_name': search_query}}, 'from': 0, 'size': 50}
+
+    async def search(self, query: dict) -> List[dict]:
+        self.calls.append(('search', query))
+        return []
+
+
+@pytest.fixture
+def storage() -> PersonStorage:
+    return PersonStorage([db.models.Person(id=str(uuid.uuid4()), full_name='Mark', roles=['actor'], film_ids=[])])
+
+
+@pytest.fixture
+def service(redis: aioredis.Redis, storage: PersonStorage) -> PersonService:
+    # LocalCache(maxsize=0) - читаем только из Redis
+    model_cache = ModelCache(db.models.Person, RedisCacheStorage(redis), local=LocalCache(maxsize=0),
+                             index='persons', negative_ttl=NEGATIVE_TTL)
+    return PersonService(model_cache, storage, film_storage=None)
+
+
+@pytest.mark.asyncio
+async def test_missing_id_cached_as_not_found(service: PersonService, storage: PersonStorage,
+                                              redis: aioredis.Redis):
+    # WHEN an id that is not in elastic is requested
+    missing_id = str(uuid.uuid4())
+    assert await service.get_entry_by_id(missing_id) is None
+
+    # THEN it is cached as not found for NEGATIVE_CACHE_TTL
+    key = service.cache.id_key(missing_id)
+    assert (await service.cache.get_entry_by_id(missing_id)).value is NOT_FOUND
+    assert 0 < await redis.ttl(key) <= NEGATIVE_TTL
+
+    # AND the next request does not go to elastic
+    assert await service.get_entry_by_id(missing_id) is None
+    assert storage.calls == [('mget', [missing_id])]
+    await redis.delete(key)
+
+
+@pytest.mark.asyncio
+async def test_empty_search_cached_as_not_found(service: PersonService, storage: PersonStorage,
+                                                redis: aioredis.Redis):
+    # WHEN a search finds nothing
+    query = await storage.build_search_query(f'nobody {uuid.uuid4()}')
+    assert await service.search(query['query']['match']['full_name']) == []
+
+    # THEN the empty result is cached as not found for NEGATIVE_CACHE_TTL
+    key = service.cache.query_key(query)
+    assert await service.cache.get_by_elastic_query(query) is NOT_FOUND
+    assert 0 < await redis.ttl(key) <= NEGATIVE_TTL
+
+    # AND the same search does not go to elastic again
+    assert await service.search(query['query']['match']['full_name']) == []
+    assert storage.calls == [('search', query)]
+    await redis.delete(key)
+
+
+@pytest.mark.asyncio
+async def test_bulk_get_skips_not_found_ids(service: PersonService, storage: PersonStorage, redis: aioredis.Redis):
+    # GIVEN an id cached as not found
+    person_id = next(iter(storage.persons))
+    missing_id = str(uuid.uuid4())
+    await service.cache.set_many_not_found_by_ids([missing_id])
+
+    # WHEN it is requested together with an existing id
+    persons = await service.bulk_get_by_ids([missing_id, person_id])
+
+    # THEN it is left out of the result and of the elastic mget
+    assert [person.id for person in persons] == [person_id]
+    assert storage.calls == [('mget', [person_id])]
+    await redis.delete(service.cache.id_key(missing_id), service.cache.id_key(person_id))
@@ -277,6 +277,17 @@ async def test_person_without_films(make_get_request, es_client: AsyncElasticsea
     assert response.status == 404
 
 
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_unknown_person_films(make_get_request, es_client: AsyncElasticsearch, person_movies: List,
+                                    persons: List):
+    person_film_endpoint = '/person/00000000-0000-0000-0000-000000000000/film'
+    response = await make_get_request(person_film_endpoint)
+
+    assert response.status == 404
+    assert response.body['detail'] == 'person not found'
+
+
 # noinspection PyUnusedLocal
 @pytest.mark.asyncio
 async def test_redis_cache(make_get_request, redis: Redis, persons: List):
@@ -0,0 +1,151 @@
+import uuid
+from typing import List, Optional
+
+import aioredis
+import orjson
+import pytest
+from starlette.datastructures import Headers
+
+from db import cache, invalidation
+from db.cache import RedisCacheStorage, ResponseCache
+from middleware import ResponseCacheMiddleware
+
+FILM_ID = 'a9dc6ac4-2a83-4fa2-9eaa-1b5d0d6b3cd0'
+PERSON_ID = '1e6d0e8b-6b5f-4b42-8c3b-2d8d6f2a2c51'
+BODY = orjson.dumps({'uuid': FILM_ID, 'title': 'Star Wars', 'actors': [{'uuid': PERSON_ID, 'full_name': 'Mark'}]})
+HEADERS = [(b'content-type', b'application/json'), (b'etag', b'"abc"'), (b'cache-control', b'max-age=60')]
+
+
+class App:
+    # Приложение за кэшем: считает, сколько запросов до него дошло
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+        await send({'type': 'http.response.body', 'body': BODY})
+
+
+async def request(middleware: ResponseCacheMiddleware, path: str,
+                  if_none_match: Optional[str] = None) -> List[dict]:
+    headers = [(b'if-none-match', if_none_match.encode())] if if_none_match else []
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': headers}
+    messages: List[dict] = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages
+
+
+@pytest.fixture
+def storage(redis: aioredis.Redis, monkeypatch) -> RedisCacheStorage:
+    storage = RedisCacheStorage(redis)
+    monkeypatch.setattr(cache, 'cache', storage)
+    return storage
+
+
+def test_key_ignores_param_order():
+    # THEN the same params in any order give the same key, other paths and values give other keys
+    key = ResponseCache.key('/v1/film/', b'query=star&page%5Bsize%5D=10')
+    assert key == ResponseCache.key('/v1/film/', b'page%5Bsize%5D=10&query=star')
+    assert key != ResponseCache.key('/v1/person/', b'query=star&page%5Bsize%5D=10')
+    assert key != ResponseCache.key('/v1/film/', b'query=star&page%5Bsize%5D=20')
+
+
+def test_ref_ids():
+    # THEN every uuid in the body is referenced once, including nested ones
+    assert sorted(ResponseCache.ref_ids(orjson.dumps([orjson.loads(BODY), {'uuid': FILM_ID}]))) == sorted(
+        [FILM_ID, PERSON_ID])
+    assert ResponseCache.ref_ids(b'not json') == []
+
+
+@pytest.mark.asyncio
+async def test_max_age_aged_on_hit(storage: RedisCacheStorage, redis: aioredis.Redis):
+    # GIVEN a response cached 25 seconds ago with max-age=60
+    response_cache = ResponseCache(storage, ttl=60)
+    key = response_cache.key(f'/v1/film/{uuid.uuid4()}', b'')
+    await response_cache.set(key, HEADERS, BODY)
+    raw_meta, _, body = (await redis.get(key)).partition(b'\n')
+    meta = orjson.loads(raw_meta)
+    meta['t'] -= 25
+    await redis.set(key, orjson.dumps(meta) + b'\n' + body)
+
+    # WHEN it is read
+    headers, cached_body = await response_cache.get(key)
+
+    # THEN max-age is what is left of it
+    assert dict(headers)[b'cache-control'] == b'max-age=35'
+    assert cached_body == BODY
+    await redis.delete(key)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('data', [b'{"t": 1, "h"\n{}', b'[["etag", "\\"abc\\""]]\n{}', b'{"h": []}\n{}'])
+async def test_corrupt_entry_is_a_miss(storage: RedisCacheStorage, redis: aioredis.Redis, data: bytes):
+    # GIVEN a cached response that is truncated or in the format without the store time
+    response_cache = ResponseCache(storage)
+    key = response_cache.key(f'/v1/film/{uuid.uuid4()}', b'')
+    await redis.set(key, data)
+
+    # THEN it is a miss and the entry is dropped
+    assert await response_cache.get(key) is None
+    assert await redis.get(key) is None
+
+
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_not_modified_from_cache(storage: RedisCacheStorage):
+    # GIVEN a response that is already cached
+    app = App()
+    middleware = ResponseCacheMiddleware(app)
+    path = f'/v1/film/{uuid.uuid4()}'
+    await request(middleware, path)
+
+    # WHEN it is requested again with its ETag
+    messages = await request(middleware, path, if_none_match='"abc"')
+
+    # THEN 304 is returned from the cache, without the body and without calling the app
+    assert messages[0]['status'] == 304
+    assert Headers(raw=messages[0]['headers'])['etag'] == '"abc"'
+    assert messages[1]['body'] == b''
+    assert app.calls == 1
+
+    # AND without the ETag the full cached response is returned
+    messages = await request(middleware, path)
+    assert messages[0]['status'] == 200
+    assert messages[1]['body'] == BODY
+    assert app.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_export_not_cached(storage: RedisCacheStorage, redis: aioredis.Redis):
+    # WHEN export is requested twice
+    app = App()
+    middleware = ResponseCacheMiddleware(app)
+    await request(middleware, '/v1/film/export')
+    await request(middleware, '/v1/film/export')
+
+    # THEN both requests reach the app and nothing is cached
+    assert app.calls == 2
+    assert await redis.get(ResponseCache.key('/v1/film/export', b'')) is None
+
+
+@pytest.mark.asyncio
+async def test_invalidation_drops_cached_response(storage: RedisCacheStorage, redis: aioredis.Redis):
+    # GIVEN a cached response with a film and a person
+    response_cache = ResponseCache(storage, track_refs=True)
+    key = response_cache.key(f'/v1/film/{uuid.uuid4()}', b'')
+    await response_cache.set(key, HEADERS, BODY)
+
+    # WHEN the person is changed
+    keys = await invalidation.invalidate(storage, 'persons', [PERSON_ID], publish=False)
+
+    # THEN the response is dropped from the cache
+    assert key in keys
+    assert await response_cache.get(key) is None
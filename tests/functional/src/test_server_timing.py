@@ -0,0 +1,74 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import orjson
+import pytest
+from starlette.datastructures import Headers
+
+from middleware import ServerTimingMiddleware
+from timing import phase
+
+DEBUG_TOKEN = 'secret'
+
+
+async def app(scope, receive, send):
+    with phase('redis'):
+        await asyncio.sleep(0)
+    with phase('es'):
+        await asyncio.sleep(0)
+    with phase('es'):
+        await asyncio.sleep(0)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+async def request(enabled: bool, headers: Optional[Dict[str, str]] = None) -> Headers:
+    middleware = ServerTimingMiddleware(app, enabled=enabled, debug_token=DEBUG_TOKEN)
+    scope = {'type': 'http', 'method': 'GET', 'path': '/v1/film/',
+             'headers': [(name.encode(), value.encode()) for name, value in (headers or {}).items()]}
+    messages: List[dict] = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return Headers(raw=messages[0]['headers'])
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header():
+    # WHEN Server-Timing is enabled
+    headers = await request(enabled=True)
+
+    # THEN every phase is reported with its number of calls, plus the total
+    metrics = {metric.split(';')[0]: metric for metric in headers['server-timing'].split(', ')}
+    assert list(metrics) == ['redis', 'es', 'total']
+    assert 'desc="1 calls"' in metrics['redis']
+    assert 'desc="2 calls"' in metrics['es']
+    assert 'x-debug-timing' not in headers
+
+
+@pytest.mark.asyncio
+async def test_server_timing_disabled():
+    # WHEN Server-Timing is disabled and no debug token is sent
+    headers = await request(enabled=False, headers={'x-debug-token': 'wrong'})
+
+    # THEN no timing headers are added
+    assert 'server-timing' not in headers
+    assert 'x-debug-timing' not in headers
+
+
+@pytest.mark.asyncio
+async def test_server_timing_debug_token():
+    # WHEN Server-Timing is disabled, but the request has the debug token
+    headers = await request(enabled=False, headers={'x-debug-token': DEBUG_TOKEN})
+
+    # THEN the header and the JSON breakdown are returned for this request
+    assert 'server-timing' in headers
+    debug = orjson.loads(headers['x-debug-timing'])
+    assert debug['phases']['es']['count'] == 2
+    assert debug['phases']['redis']['count'] == 1
+    assert debug['total_ms'] >= debug['phases']['es']['ms']
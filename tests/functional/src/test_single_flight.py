@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from services.base import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_one_call():
+    # GIVEN a slow load behind single flight
+    flights = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return 'film'
+
+    # WHEN several callers ask for the same key concurrently
+    waiters = [asyncio.ensure_future(flights.do('key', load)) for _ in range(5)]
+    await asyncio.sleep(0)
+    assert len(flights) == 1
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    # THEN the load runs once, everyone gets its result and the key is released
+    assert calls == 1
+    assert results == ['film'] * 5
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_cancelled_waiter():
+    # GIVEN two callers waiting for the same load
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        return 'film'
+
+    first = asyncio.ensure_future(flights.do('key', load))
+    second = asyncio.ensure_future(flights.do('key', load))
+    await asyncio.sleep(0)
+
+    # WHEN the first caller is cancelled (client disconnected)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    # THEN the shared load is not cancelled and the second caller gets its result
+    assert await second == 'film'
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors_and_retries():
+    # GIVEN a load that fails once
+    flights = SingleFlight()
+    attempts = 0
+
+    async def load():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise ConnectionError('elastic is down')
+        return 'film'
+
+    # WHEN concurrent callers share the failed call
+    results = await asyncio.gather(flights.do('key', load), flights.do('key', load), return_exceptions=True)
+
+    # THEN both get the error, and the next call starts a new load
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert await flights.do('key', load) == 'film'
+    assert attempts == 2
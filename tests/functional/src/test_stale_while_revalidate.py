@@ -0,0 +1,72 @@
+import asyncio
+
+import aioredis
+import pytest
+
+import db.models
+from db.cache import LocalCache, ModelCache, RedisCacheStorage
+
+QUERY = {'query': {'match': {'title': 'stale'}}, 'from': 0, 'size': 50}
+
+
+def make_film(title: str) -> db.models.FilmShort:
+    return db.models.FilmShort(id='3d825f60-9fff-4dfe-b294-1a45fa1e115d', title=title, imdb_rating=5.0)
+
+
+def make_cache(redis: aioredis.Redis, ttl: int) -> ModelCache:
+    # LocalCache(maxsize=0) - читаем только из Redis
+    return ModelCache(db.models.FilmShort, RedisCacheStorage(redis), local=LocalCache(maxsize=0), index='movies',
+                      ttl=ttl, stale_ttl=60)
+
+
+@pytest.mark.asyncio
+async def test_stale_search_served_and_refreshed(redis: aioredis.Redis):
+    # GIVEN a cached search that is already stale (ttl=0), but still stored for stale_ttl
+    cache = make_cache(redis, ttl=0)
+    await cache.set_by_elastic_query(QUERY, [make_film('Old title')])
+    refreshed = asyncio.Event()
+    refreshes = 0
+
+    async def refresh():
+        nonlocal refreshes
+        refreshes += 1
+        await make_cache(redis, ttl=60).set_by_elastic_query(QUERY, [make_film('New title')])
+        refreshed.set()
+
+    # WHEN it is read twice before the refresh finishes
+    first = await cache.get_by_elastic_query(QUERY, refresh=refresh)
+    second = await cache.get_by_elastic_query(QUERY, refresh=refresh)
+
+    # THEN the stale result is returned right away and only one refresh runs in the background
+    assert [film.title for film in first] == ['Old title']
+    assert [film.title for film in second] == ['Old title']
+    await asyncio.wait_for(refreshed.wait(), timeout=5)
+    assert refreshes == 1
+
+    # AND the next read gets the refreshed result, which is fresh and does not trigger a refresh
+    fresh = await cache.get_by_elastic_query(QUERY, refresh=refresh)
+    assert [film.title for film in fresh] == ['New title']
+    assert refreshes == 1
+    await redis.delete(cache.query_key(QUERY))
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_stale_search(redis: aioredis.Redis):
+    # GIVEN a stale cached search and a refresh that fails
+    cache = make_cache(redis, ttl=0)
+    await cache.set_by_elastic_query(QUERY, [make_film('Old title')])
+    failed = asyncio.Event()
+
+    async def refresh():
+        failed.set()
+        raise ConnectionError('elastic is down')
+
+    # WHEN it is read and the refresh fails
+    stale = await cache.get_by_elastic_query(QUERY, refresh=refresh)
+    await asyncio.wait_for(failed.wait(), timeout=5)
+    await asyncio.sleep(0)
+
+    # THEN the stale result is still served
+    assert [film.title for film in stale] == ['Old title']
+    assert [film.title for film in await cache.get_by_elastic_query(QUERY)] == ['Old title']
+    await redis.delete(cache.query_key(QUERY))
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from starlette import status
+
+import main
+import warmup
+
+
+@pytest.fixture
+def warming_up():
+    warmup.ready.clear()
+    yield
+    warmup.ready.set()
+
+
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_ready_after_warm_up(monkeypatch, warming_up):
+    # GIVEN a warm-up that is still running
+    release = asyncio.Event()
+
+    async def warm_up_default_services():
+        await release.wait()
+
+    monkeypatch.setattr(warmup, 'warm_up_default_services', warm_up_default_services)
+    task = asyncio.ensure_future(warmup.warm_up_in_background())
+    await asyncio.sleep(0)
+
+    # THEN readiness returns 503
+    assert (await main.health_ready()).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    # WHEN the warm-up finishes
+    release.set()
+    await task
+
+    # THEN readiness returns 200
+    assert (await main.health_ready()).status_code == status.HTTP_200_OK
+
+
+# noinspection PyUnusedLocal
+@pytest.mark.asyncio
+async def test_ready_after_failed_warm_up(monkeypatch, warming_up):
+    # GIVEN a warm-up that fails
+    async def warm_up_default_services():
+        raise ConnectionError('elastic is down')
+
+    monkeypatch.setattr(warmup, 'warm_up_default_services', warm_up_default_services)
+
+    # WHEN it finishes
+    await warmup.warm_up_in_background()
+
+    # THEN the service still becomes ready and serves with a cold cache
+    assert (await main.health_ready()).status_code == status.HTTP_200_OK